@@ -0,0 +1,245 @@
+"""
+Benchmarks ReviewBook on synthetic repertoires.
+
+    python benchmark.py --nodes 10000 100000 --output bench_output.json
+
+For each size, a repertoire is generated for both colors (unless it already exists in --workdir),
+then construction, next_move, pending_review_count, _save and the startup diff against an edited
+repertoire are timed. The results are written as JSON.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+from book_tree import ROOT, pack_move
+from review_book import ReviewBook
+
+
+def generate_tree(user_color, nodes, depth, branching, seed=0) -> chess.pgn.Game:
+    """
+    A random repertoire: one move where the user is to move (always the same one for a position, like in a
+    real repertoire), and up to branching opponent moves elsewhere, down to the given depth.
+    """
+    rng = random.Random(seed)
+    tree = chess.pgn.Game()
+    count = 0
+    board = chess.Board()
+    stack = [(tree, False)]
+    while stack and count < nodes:
+        node, visited = stack.pop()
+        if visited:
+            board.pop()
+            continue
+        if node.move is not None:
+            board.push(node.move)
+            stack.append((node, True))
+        if board.ply() >= depth or board.is_game_over():
+            continue
+        moves = sorted(board.legal_moves, key=lambda m: m.uci())
+        if board.turn == user_color:
+            moves = [random.Random(chess.polyglot.zobrist_hash(board)).choice(moves)]
+        else:
+            moves = rng.sample(moves, min(len(moves), rng.randint(1, branching)))
+        for move in moves:
+            child = node.add_variation(move)
+            count += 1
+            stack.append((child, False))
+    return tree
+
+
+def write_chapters(tree: chess.pgn.Game, out_dir: Path, chapters: int) -> int:
+    """Splits the tree into (at least) the given number of PGN files, one per subtree of the first level that is wide enough."""
+    level = [tree]
+    while len(level) < chapters:
+        next_level = [v for node in level for v in node.variations]
+        if not next_level:
+            break
+        level = next_level
+
+    os.makedirs(out_dir, exist_ok=True)
+    for i, node in enumerate(level):
+        chapter = chess.pgn.Game()
+        chapter.headers["Event"] = f"Chapter {i}"
+        prefix = []
+        n = node
+        while n.parent is not None:
+            prefix.append(n.move)
+            n = n.parent
+        dst = chapter
+        for move in reversed(prefix):
+            dst = dst.add_variation(move)
+        _copy_subtree(node, dst)
+        with open(out_dir / f"{i:05d}.pgn", 'w', encoding='utf-8') as pgn:
+            print(chapter, file=pgn, end="\n\n")
+    return len(level)
+
+
+def _copy_subtree(src, dst):
+    stack = [(src, dst)]
+    while stack:
+        s, d = stack.pop()
+        for v in s.variations:
+            stack.append((v, d.add_variation(v.move)))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def latency_summary(samples):
+    samples = sorted(samples)
+    return {
+        "calls": len(samples),
+        "mean_us": statistics.fmean(samples) * 1e6,
+        "p50_us": samples[len(samples) // 2] * 1e6,
+        "p99_us": samples[min(len(samples) - 1, len(samples) * 99 // 100)] * 1e6,
+        "max_us": samples[-1] * 1e6,
+    }
+
+
+def bench_next_move(book: ReviewBook, games, seed=0):
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(games):
+        board = chess.Board()
+        node = ROOT
+        while node is not None:
+            if board.turn == book.user_color:
+                main = book.tree.main_child(node)
+                if main is None:
+                    break
+                if rng.random() < 0.05:
+                    # sometimes the user plays a wrong move, next_move is timed once more for it
+                    board.push(next(m for m in board.legal_moves if m != book.tree.move(main)))
+                    node = None
+                else:
+                    node = main
+                    board.push(book.tree.move(node))
+            start = time.perf_counter()
+            move, bottom_reached, _ = book.next_move(board)
+            samples.append(time.perf_counter() - start)
+            if not move or bottom_reached:
+                break
+            node = book.tree.child(node, pack_move(move))
+            board.push(move)
+    return latency_summary(samples)
+
+
+def edit_repertoire(input_dir: Path, seed=0):
+    """Removes the last variation of one chapter and adds a new one to another, as a user editing a study would."""
+    rng = random.Random(seed)
+    paths = sorted(input_dir.glob('**/*.pgn'))
+    for path in rng.sample(paths, min(2, len(paths))):
+        with open(path, encoding='utf-8') as pgn:
+            game = chess.pgn.read_game(pgn)
+        node = game
+        while node.variations:
+            node = node.variations[-1]
+        if node.parent is not game and len(node.parent.variations) > 1:
+            node.parent.remove_variation(node)
+        else:
+            board = node.board()
+            for move in list(board.legal_moves)[:2]:
+                node.add_variation(move)
+        with open(path, 'w', encoding='utf-8') as pgn:
+            print(game, file=pgn, end="\n\n")
+
+
+def bench_color(workdir: Path, user_color, nodes, args):
+    name = 'white' if user_color == chess.WHITE else 'black'
+    repdir = workdir / f"{nodes}" / 'repertoire' / name
+    revdir = workdir / f"{nodes}" / 'review'
+    result = {"color": name}
+
+    if not repdir.exists():
+        tree = generate_tree(user_color, nodes, args.depth, args.branching, args.seed)
+        result["files"] = write_chapters(tree, repdir, args.chapters)
+    if revdir.exists():
+        shutil.rmtree(revdir)
+    os.makedirs(revdir)
+    review_path = revdir / f"{name}.pgn"
+
+    result["construct_cold_s"], book = timed(ReviewBook, review_path, repdir, user_color)
+    result["nodes"] = len(book.tree) - 1
+    result["construct_cached_s"], book = timed(ReviewBook, review_path, repdir, user_color)
+    os.remove(book.cache_path)
+    result["construct_review_pgn_s"], book = timed(ReviewBook, review_path, repdir, user_color)
+
+    result["next_move"] = bench_next_move(book, args.games, args.seed)
+    samples = [timed(book.pending_review_count)[0] for _ in range(100)]
+    result["pending_review_count"] = latency_summary(samples)
+    result["save_s"], _ = timed(book._save)
+    book.compact()
+
+    edit_repertoire(repdir, args.seed)
+    diff_times = []
+    update_review_node = ReviewBook._update_review_node
+
+    def timed_update_review_node(self, *args):
+        start = time.perf_counter()
+        update_review_node(self, *args)
+        diff_times.append(time.perf_counter() - start)
+
+    ReviewBook._update_review_node = timed_update_review_node
+    try:
+        result["construct_edited_s"], book = timed(ReviewBook, review_path, repdir, user_color)
+    finally:
+        ReviewBook._update_review_node = update_review_node
+    result["update_review_node_s"] = sum(diff_times)
+    result["added_moves"] = book.added_moves
+    result["deleted_moves"] = book.deleted_moves
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ReviewBook on synthetic repertoires.")
+    parser.add_argument('--nodes', type=int, nargs='+', default=[10000], help="repertoire sizes (moves per color)")
+    parser.add_argument('--depth', type=int, default=40, help="maximum depth of the variations (plies)")
+    parser.add_argument('--branching', type=int, default=3, help="maximum number of opponent moves per position")
+    parser.add_argument('--chapters', type=int, default=50, help="minimum number of PGN files per color")
+    parser.add_argument('--games', type=int, default=200, help="games played to time next_move")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', type=Path, help="where to generate the repertoires (reused if present)")
+    parser.add_argument('--output', type=Path, help="JSON report (default: stdout)")
+    args = parser.parse_args()
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix='repertition-bench-'))
+    report = {
+        "python": platform.python_version(),
+        "chess": chess.__version__,
+        "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        "results": [],
+    }
+    try:
+        for nodes in args.nodes:
+            for color in (chess.WHITE, chess.BLACK):
+                result = bench_color(workdir, color, nodes, args)
+                result["requested_nodes"] = nodes
+                report["results"].append(result)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
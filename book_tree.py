@@ -0,0 +1,197 @@
+from array import array
+from typing import Iterator, List, Optional, Tuple
+
+import chess
+
+
+ROOT = 0
+NONE = -1
+
+# review_times value of moves that were never reviewed
+UNSCHEDULED = -(1 << 63)
+
+# nodes with this many children get a move -> child dict, the others are searched linearly
+WIDE_NODE = 8
+
+
+def pack_move(move: chess.Move) -> int:
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def unpack_move(code: int) -> chess.Move:
+    return chess.Move(code & 63, code >> 6 & 63, code >> 12 or None)
+
+
+class BookTree:
+    """
+    A tree of moves from the standard starting position, stored in parallel arrays indexed by node number
+    (the root is node 0, and children always have higher numbers than their parents). Children are kept
+    in a linked list, the first one being the main move. Review times are seconds since the epoch and
+    intervals are minutes. Compared to chess.pgn nodes, this takes about a tenth of the memory.
+    """
+
+    def __init__(self, headers=None):
+        self.headers = dict(headers or {})
+        self.moves = array('H', [0])
+        self.parents = array('i', [NONE])
+        self.first_children = array('i', [NONE])
+        self.last_children = array('i', [NONE])
+        self.next_siblings = array('i', [NONE])
+        self.depths = array('H', [0])
+        self.review_times = array('q', [UNSCHEDULED])
+        self.intervals = array('i', [NONE])
+        self.comments = {}  # comment text other than the review annotations, by node
+        self.wide = {}  # {packed move: child} by node, for nodes with at least WIDE_NODE children
+        self.removed = 0
+
+    def __len__(self) -> int:
+        return len(self.moves)
+
+    def turn(self, node: int) -> chess.Color:
+        return self.depths[node] % 2 == 0
+
+    def move(self, node: int) -> chess.Move:
+        return unpack_move(self.moves[node])
+
+    def children(self, node: int) -> List[int]:
+        children = []
+        child = self.first_children[node]
+        while child != NONE:
+            children.append(child)
+            child = self.next_siblings[child]
+        return children
+
+    def main_child(self, node: int) -> Optional[int]:
+        child = self.first_children[node]
+        return None if child == NONE else child
+
+    def has_children(self, node: int) -> bool:
+        return self.first_children[node] != NONE
+
+    def child(self, node: int, packed_move: int) -> Optional[int]:
+        wide = self.wide.get(node)
+        if wide is not None:
+            return wide.get(packed_move)
+        child = self.first_children[node]
+        while child != NONE:
+            if self.moves[child] == packed_move:
+                return child
+            child = self.next_siblings[child]
+        return None
+
+    def add_child(self, node: int, packed_move: int) -> int:
+        child = len(self.moves)
+        self.moves.append(packed_move)
+        self.parents.append(node)
+        self.first_children.append(NONE)
+        self.last_children.append(NONE)
+        self.next_siblings.append(NONE)
+        self.depths.append(self.depths[node] + 1)
+        self.review_times.append(UNSCHEDULED)
+        self.intervals.append(NONE)
+
+        last = self.last_children[node]
+        if last == NONE:
+            self.first_children[node] = child
+        else:
+            self.next_siblings[last] = child
+        self.last_children[node] = child
+
+        wide = self.wide.get(node)
+        if wide is not None:
+            wide[packed_move] = child
+        elif node not in self.wide and self._count_children(node) >= WIDE_NODE:
+            self.wide[node] = {self.moves[c]: c for c in self.children(node)}
+        return child
+
+    def remove_child(self, node: int, child: int) -> None:
+        """Unlinks the subtree of child. Its nodes stay allocated until compacted() is called."""
+        previous, current = NONE, self.first_children[node]
+        while current != child:
+            previous, current = current, self.next_siblings[current]
+        following = self.next_siblings[child]
+        if previous == NONE:
+            self.first_children[node] = following
+        else:
+            self.next_siblings[previous] = following
+        if self.last_children[node] == child:
+            self.last_children[node] = previous
+        wide = self.wide.get(node)
+        if wide is not None:
+            del wide[self.moves[child]]
+        self.removed += 1
+
+    def path(self, node: int) -> List[int]:
+        """The packed moves leading to node."""
+        moves = []
+        while node != ROOT:
+            moves.append(self.moves[node])
+            node = self.parents[node]
+        moves.reverse()
+        return moves
+
+    def find(self, packed_moves) -> Optional[int]:
+        node = ROOT
+        for packed_move in packed_moves:
+            node = self.child(node, packed_move)
+            if node is None:
+                return None
+        return node
+
+    def preorder(self, node: int = ROOT) -> Iterator[int]:
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(self.children(node)))
+
+    def subtree_size(self, node: int) -> int:
+        return sum(1 for _ in self.preorder(node))
+
+    def add_subtree(self, node: int, src_tree: 'BookTree', src_node: int) -> Tuple[int, int]:
+        """Adds a copy of the subtree of src_node (another tree's node) as a child of node. Returns (child, number of moves added)."""
+        child = self.add_child(node, src_tree.moves[src_node])
+        count = 1
+        stack = [(child, src_node)]
+        while stack:
+            dst, src = stack.pop()
+            for src_child in src_tree.children(src):
+                stack.append((self.add_child(dst, src_tree.moves[src_child]), src_child))
+                count += 1
+        return child, count
+
+    def subtree_hashes(self) -> array:
+        """
+        Structural hash of each subtree, computed Merkle-style from the move and the hashes of the children
+        (in any order), so that two subtrees with the same moves have the same hash.
+        """
+        hashes = array('q', bytes(8 * len(self.moves)))
+        for node in range(len(self.moves) - 1, -1, -1):  # children are numbered after their parents
+            hashes[node] = hash((self.moves[node], *sorted(hashes[child] for child in self.children(node))))
+        return hashes
+
+    def compacted(self) -> 'BookTree':
+        """A copy without the nodes removed by remove_child (node numbers change)."""
+        if not self.removed:
+            return self
+        tree = BookTree(self.headers)
+        new_nodes = {ROOT: ROOT}
+        for node in self.preorder():
+            if node == ROOT:
+                continue
+            new = tree.add_child(new_nodes[self.parents[node]], self.moves[node])
+            new_nodes[node] = new
+            tree.review_times[new] = self.review_times[node]
+            tree.intervals[new] = self.intervals[node]
+            if node in self.comments:
+                tree.comments[new] = self.comments[node]
+        if ROOT in self.comments:
+            tree.comments[ROOT] = self.comments[ROOT]
+        return tree
+
+    def _count_children(self, node: int) -> int:
+        count, child = 0, self.first_children[node]
+        while child != NONE:
+            count += 1
+            child = self.next_siblings[child]
+        return count
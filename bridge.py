@@ -1,21 +1,213 @@
+import collections
+import concurrent.futures
+import os
+import threading
+from typing import Optional
+
 import chess
 import chess.engine
+import chess.polyglot
+
+import stats
+from engine_cache import EngineCache
 
 
+# seconds per move when the GUI doesn't give a clock (see time_manager), and for precomputed positions
 TIME_LIMIT = 1
 
-engine = None
+# seconds per precomputed position: replies are reused for searches up to engine_cache.TIME_TOLERANCE times longer,
+# which covers the budgets of usual time controls (see time_manager)
+PRECOMPUTE_TIME = 5
+
+# maximum number of engine processes, started on demand when several games need the engine at once
+POOL_SIZE = os.cpu_count() or 1
+
+engine_command = None
+pool_size = POOL_SIZE
+idle_engines = []
+engine_count = 0
+pool_lock = threading.Condition()
+
+cache = EngineCache(None)
+searches = {}  # searches in progress by position, e.g. started while pondering
+searches_lock = threading.Lock()
+precompute_boards = collections.deque()
+precompute_running = False
+precompute_lock = threading.Lock()
+precompute_thread = None
+stop_precompute = threading.Event()
+game_searches = 0  # searches of next_move in progress, precomputing waits until there are none
+game_searches_lock = threading.Condition()
 
 
-def init(command):
-    global engine
-    engine = chess.engine.SimpleEngine.popen_uci(command)
+def init(command, size=POOL_SIZE, cache_path=None):
+    global engine_command, pool_size, engine_count, cache
+    engine_command = command
+    pool_size = max(1, size)
+    cache = EngineCache(cache_path)
+    # start the first engine right away, so that a broken engine is reported on startup
+    idle_engines.append(chess.engine.SimpleEngine.popen_uci(engine_command))
+    engine_count = 1
 
 
 def cleanup():
-    engine.quit()
+    global engine_count
+    stop_precompute.set()
+    if precompute_thread:
+        precompute_thread.join()
+    cache.save()
+    with pool_lock:
+        engines = list(idle_engines)
+        idle_engines.clear()
+        engine_count -= len(engines)
+    for engine in engines:
+        _close(engine)
 
 
-def next_move(board: chess.Board) -> chess.Move:
-    result = engine.play(board, chess.engine.Limit(time=TIME_LIMIT))
+@stats.timed('bridge.next_move')
+def next_move(board: chess.Board, limit: Optional[chess.engine.Limit] = None) -> chess.Move:
+    global game_searches
+    limit = limit or chess.engine.Limit(time=TIME_LIMIT)
+    move = cache.get(board, limit)
+    if move is not None:
+        return move
+
+    key = chess.polyglot.zobrist_hash(board)
+    with searches_lock:
+        search = searches.get(key)
+        running = search is not None
+        if not running:
+            search = searches[key] = concurrent.futures.Future()
+    if running:
+        return search.result()  # wait for the same search instead of starting another one
+    with game_searches_lock:
+        game_searches += 1
+    try:
+        result = _play(board, limit=limit)
+        cache.put(board, result, limit)
+        search.set_result(result.move)
+    except BaseException as e:
+        search.set_exception(e)
+        raise
+    finally:
+        with searches_lock:
+            del searches[key]
+        with game_searches_lock:
+            game_searches -= 1
+            game_searches_lock.notify_all()
     return result.move
+
+
+def precompute(boards):
+    """
+    Analyzes the given positions in the background, one at a time and only while no game is waiting for
+    the engine, to fill the cache. Later calls queue more positions.
+    """
+    global precompute_thread, precompute_running
+
+    def run():
+        global precompute_running
+        try:
+            while True:
+                with precompute_lock:
+                    if stop_precompute.is_set() or not precompute_boards:
+                        precompute_running = False
+                        break
+                    board = precompute_boards.popleft()
+                limit = chess.engine.Limit(time=PRECOMPUTE_TIME)
+                if cache.get(board, limit) is not None or board.is_game_over():
+                    continue
+                engine = _checkout_idle()
+                if engine is None:
+                    continue  # stopped
+                cache.put(board, _play(board, engine, limit), limit)
+        except BaseException:
+            with precompute_lock:
+                precompute_running = False  # the next call starts over
+            raise
+        finally:
+            cache.save()
+
+    with precompute_lock:
+        precompute_boards.extend(boards)
+        if precompute_running:
+            return
+        precompute_running = True
+    stop_precompute.clear()
+    precompute_thread = threading.Thread(target=run, name='precompute', daemon=True)
+    precompute_thread.start()
+
+
+@stats.timed('bridge.search')
+def _play(board: chess.Board, engine=None, limit=None) -> chess.engine.PlayResult:
+    info = chess.engine.INFO_BASIC | chess.engine.INFO_SCORE
+    limit = limit or chess.engine.Limit(time=TIME_LIMIT)
+    engine = engine or _checkout()
+    try:
+        result = engine.play(board, limit, info=info)
+    except (chess.engine.EngineTerminatedError, chess.engine.EngineError):
+        # the engine crashed or misbehaved: replace it and try once more
+        _release(engine, broken=True)
+        engine = _checkout()
+        try:
+            result = engine.play(board, limit, info=info)
+        except BaseException:
+            _release(engine, broken=True)
+            raise
+    except BaseException:
+        _release(engine, broken=True)
+        raise
+    _release(engine)
+    return result
+
+
+def _checkout_idle() -> Optional[chess.engine.SimpleEngine]:
+    # an engine once no game search is running (and one is free), None if precomputing was stopped meanwhile
+    while not stop_precompute.is_set():
+        with game_searches_lock:
+            if game_searches:
+                game_searches_lock.wait(TIME_LIMIT)
+                continue
+        engine = _checkout(wait=False)
+        if engine is not None:
+            return engine
+        stop_precompute.wait(TIME_LIMIT)
+    return None
+
+
+def _checkout(wait=True) -> Optional[chess.engine.SimpleEngine]:
+    global engine_count
+    with pool_lock:
+        while not idle_engines and engine_count >= pool_size:
+            if not wait:
+                return None
+            pool_lock.wait()
+        if idle_engines:
+            return idle_engines.pop()
+        engine_count += 1
+    try:
+        return chess.engine.SimpleEngine.popen_uci(engine_command)
+    except BaseException:
+        with pool_lock:
+            engine_count -= 1
+            pool_lock.notify()
+        raise
+
+
+def _release(engine, broken=False):
+    global engine_count
+    with pool_lock:
+        if broken:
+            engine_count -= 1
+        else:
+            idle_engines.append(engine)
+        pool_lock.notify()
+    if broken:
+        _close(engine)
+
+
+def _close(engine):
+    try:
+        engine.quit()
+    except (chess.engine.EngineTerminatedError, chess.engine.EngineError, TimeoutError):
+        engine.close()
@@ -1,4 +1,15 @@
+import queue
 import sys
+import threading
+import time
+
+import stats
+
+
+# maximum length of a coalesced message (lichess chat limit)
+MAX_LENGTH = 140
+RETRIES = 5
+RETRY_DELAY = 0.5  # seconds, doubled after each failed attempt
 
 
 def default_send(msg):
@@ -6,6 +17,10 @@ def default_send(msg):
 
 
 send_func = default_send
+queued = False
+pending = queue.Queue()
+worker = None
+worker_lock = threading.Lock()
 
 
 def set_send_func(f):
@@ -13,5 +28,63 @@ def set_send_func(f):
     send_func = f
 
 
-def send(msg):
-    send_func(msg)
+def set_queued(enabled):
+    """In queued mode, messages are delivered by a background thread, so senders never wait for chat I/O."""
+    global queued
+    queued = enabled
+
+
+@stats.timed('chat.send')
+def send(msg, func=None):
+    func = func or send_func
+    if not queued:
+        func(msg)
+        return
+    _start_worker()
+    pending.put((func, msg))
+
+
+def send_batch(msgs, func=None):
+    if queued:
+        msgs = _coalesce(msgs)
+    for msg in msgs:
+        send(msg, func)
+
+
+def flush():
+    pending.join()
+
+
+def _coalesce(msgs):
+    joined = []
+    for msg in msgs:
+        if joined and len(joined[-1]) + 1 + len(msg) <= MAX_LENGTH:
+            joined[-1] += " " + msg
+        else:
+            joined.append(msg)
+    return joined
+
+
+def _start_worker():
+    global worker
+    with worker_lock:
+        if worker is None:
+            worker = threading.Thread(target=_work, name='chat', daemon=True)
+            worker.start()
+
+
+def _work():
+    while True:
+        func, msg = pending.get()
+        delay = RETRY_DELAY
+        for attempt in range(RETRIES):
+            try:
+                func(msg)
+                break
+            except Exception as e:
+                if attempt == RETRIES - 1:
+                    print(f"Chat message dropped ({e}): {msg}", file=sys.stderr)
+                else:
+                    time.sleep(delay)
+                    delay *= 2
+        pending.task_done()
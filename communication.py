@@ -1,9 +1,16 @@
 # Taken from Andoma (https://github.com/healeycodes/andoma), with minimum changes.
 # MIT License, Copyright (c) 2020 Andrew Healey
 
+import asyncio
+import functools
+import sys
+
 import chess
+import chess.engine
 import argparse
 
+import stats
+
 
 def talk(board: chess.Board, next_move):
     """
@@ -16,6 +23,81 @@ def talk(board: chess.Board, next_move):
         end = command(board, next_move, msg)
 
 
+async def talk_async(board: chess.Board, next_move, ponder=None, ponder_move=None):
+    """
+    Like talk, but searches run in an executor, so that commands like isready
+    are still answered while the bridged engine is thinking.
+    If ponder is given, "go ponder" prepares the reply with it, on a copy of the
+    board, until "ponderhit" (the reply is then computed by next_move) or "stop".
+    If ponder_move is given, it is called with the board and the best move to get
+    the expected reply.
+    """
+    loop = asyncio.get_running_loop()
+    sys.stdout.reconfigure(line_buffering=True)
+    search = None
+    ponder_task, ponder_board, pondering = None, None, False
+
+    async def go(limit):
+        _move = await loop.run_in_executor(None, functools.partial(next_move, board, limit=limit))
+        reply = ponder_move(board, _move) if ponder_move else None
+        print(f"bestmove {_move}" + (f" ponder {reply}" if reply else ""))
+
+    while True:
+        msg = await loop.run_in_executor(None, sys.stdin.readline)
+        if not msg:
+            break
+        msg = msg.strip()
+        if msg not in ("isready", "stop", "ponderhit"):
+            # the board is in use until the search finishes
+            if search and not search.done():
+                await search
+        if msg[0:2] == "go":
+            limit = go_limit(msg)
+            if ponder and "ponder" in msg.split():
+                ponder_board = board.copy()
+                ponder_task = loop.run_in_executor(None, functools.partial(ponder, ponder_board, limit=limit))
+                pondering = True
+            else:
+                search = asyncio.create_task(go(limit))
+            continue
+        if msg == "ponderhit":
+            if pondering:
+                pondering = False
+                search = asyncio.create_task(go(limit))  # finds what was prepared while pondering
+            continue
+        if msg == "stop":
+            if pondering:
+                # the user didn't play the expected move: the reply to it is discarded by the GUI, so any move
+                # is sent at once, while the search goes on in the background to fill the engine cache
+                pondering = False
+                finished = ponder_task.done() and not ponder_task.exception()
+                _move = ponder_task.result() if finished else next(iter(ponder_board.legal_moves), chess.Move.null())
+                print(f"bestmove {_move}")
+            continue  # otherwise, the move is sent as soon as it is found
+        if command(board, next_move, msg):
+            break
+
+    for task in (search, ponder_task):
+        if task:
+            await task
+
+
+def go_limit(msg: str):
+    """
+    The clocks, increments (wtime btime winc binc, in milliseconds), movestogo, movetime, depth and nodes
+    of a "go" command, None if there are none.
+    """
+    names = {"wtime": "white_clock", "btime": "black_clock", "winc": "white_inc", "binc": "black_inc",
+             "movestogo": "remaining_moves", "movetime": "time", "depth": "depth", "nodes": "nodes"}
+    milliseconds = ("wtime", "btime", "winc", "binc", "movetime")
+    tokens = msg.split()
+    values = {}
+    for name, value in zip(tokens[1:], tokens[2:]):
+        if name in names and value.lstrip("-").isdigit():
+            values[names[name]] = int(value) / 1000 if name in milliseconds else int(value)
+    return chess.engine.Limit(**values) if values else None
+
+
 def command(board: chess.Board, next_move, msg: str):
     """
     Accept UCI commands and respond.
@@ -32,6 +114,7 @@ def command(board: chess.Board, next_move, msg: str):
     if msg == "uci":
         print("id name RepeRtition")
         print("id author Maximiliano Pin")
+        print("option name Ponder type check default false")
         print("uciok")
         return
 
@@ -48,20 +131,26 @@ def command(board: chess.Board, next_move, msg: str):
 
         # Set starting position
         if tokens[1] == "startpos":
-            board.reset()
+            fen = chess.STARTING_FEN
             moves_start = 2
         elif tokens[1] == "fen":
-            fen = " ".join(tokens[2:8])
-            board.set_fen(fen)
+            fen = chess.Board(" ".join(tokens[2:8])).fen()
             moves_start = 8
         else:
             return
 
-        # Apply moves
-        if len(tokens) <= moves_start or tokens[moves_start] != "moves":
-            return
+        if len(tokens) > moves_start and tokens[moves_start] == "moves":
+            moves = tokens[(moves_start+1):]
+        else:
+            moves = []
 
-        for move in tokens[(moves_start+1):]:
+        # Apply moves. Usually the new list extends the current game, then only the new moves are pushed.
+        played = len(board.move_stack)
+        if (played > len(moves) or board.root().fen() != fen
+                or any(move.uci() != uci for move, uci in zip(board.move_stack, moves))):
+            board.set_fen(fen)
+            played = 0
+        for move in moves[played:]:
             board.push_uci(move)
 
     if msg == "d":
@@ -69,7 +158,17 @@ def command(board: chess.Board, next_move, msg: str):
         print(board)
         print(board.fen())
 
+    if tokens and tokens[0] == "stats":
+        # Non-standard command: "stats on|off|reset" controls the collection of timings, "stats" shows them
+        if len(tokens) > 1 and tokens[1] in ("on", "off"):
+            stats.set_enabled(tokens[1] == "on")
+        elif len(tokens) > 1 and tokens[1] == "reset":
+            stats.reset()
+        else:
+            print(stats.report())
+        return
+
     if msg[0:2] == "go":
-        _move = next_move(board)
+        _move = next_move(board, limit=go_limit(msg))
         print(f"bestmove {_move}")
         return
@@ -0,0 +1,90 @@
+import marshal
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import chess
+import chess.engine
+import chess.polyglot
+
+
+MAX_ENTRIES = 100000
+
+# stored in place of the score of mate positions
+MATE_SCORE = 100000
+
+# a reply is reused for searches up to this many times longer than its own: a search a few times longer
+# rarely changes the move, and the budgets of a game vary with the clock and the time saved in book
+TIME_TOLERANCE = 5
+
+
+class EngineCache:
+    """
+    Engine replies by position (Zobrist hash), with the depth, score and time of their search.
+    Least recently used entries are evicted first.
+    """
+
+    def __init__(self, path: Optional[Path], max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.dirty = False
+        if path is not None and path.exists():
+            try:
+                with open(path, 'rb') as f:
+                    self.entries.update(marshal.load(f))
+            except (EOFError, ValueError, TypeError):
+                pass  # corrupt cache, start over
+
+    def __contains__(self, board: chess.Board) -> bool:
+        return chess.polyglot.zobrist_hash(board) in self.entries
+
+    def get(self, board: chess.Board, limit: Optional[chess.engine.Limit] = None) -> Optional[chess.Move]:
+        """
+        The cached reply, None if there is none, or if its search was shallower than limit asks,
+        or more than TIME_TOLERANCE times shorter.
+        """
+        key = chess.polyglot.zobrist_hash(board)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if limit is not None:
+                seconds = entry[3] if len(entry) > 3 else 0  # not stored by older versions
+                if (limit.depth is not None and entry[1] < limit.depth
+                        or limit.time is not None and seconds * TIME_TOLERANCE < limit.time):
+                    return None
+            self.entries.move_to_end(key)
+        move = chess.Move.from_uci(entry[0])
+        return move if board.is_legal(move) else None
+
+    def put(self, board: chess.Board, result: chess.engine.PlayResult, limit: Optional[chess.engine.Limit] = None) -> None:
+        if result.move is None:
+            return
+        score = result.info.get('score')
+        seconds = limit.time if limit is not None and limit.time is not None else result.info.get('time', 0)
+        entry = (result.move.uci(),
+                 result.info.get('depth', 0),
+                 score.relative.score(mate_score=MATE_SCORE) if score is not None else None,
+                 seconds)
+        key = chess.polyglot.zobrist_hash(board)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+
+    def save(self) -> None:
+        if self.path is None or not self.dirty:
+            return
+        with self.lock:
+            data = list(self.entries.items())
+            self.dirty = False
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            marshal.dump(data, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,120 @@
+"""
+Forecast of the review workload: how many user moves fall due per hour or day, per color and per opening.
+
+    python forecast.py --days 28 --bucket day --depth 2
+
+Requires NumPy. The review times are extracted from the arrays of the book tree in one step,
+and everything else is computed vectorized, so this stays fast for hundreds of thousands of moves.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import chess
+import numpy as np
+
+import clk
+from book_tree import ROOT, UNSCHEDULED, unpack_move
+from review_book import ReviewBook
+
+
+BUCKETS = {'hour': 3600, 'day': 86400}
+
+# upper bounds of the interval histogram
+INTERVAL_BINS = [('1h', 60), ('1d', 1440), ('1w', 10080), ('30d', 43200), ('180d', 259200)]
+
+
+class ReviewArrays:
+    """Review times (seconds since the epoch), intervals (minutes) and openings of all user moves of a book."""
+
+    def __init__(self, book: ReviewBook, depth: int = 2):
+        tree = book.tree
+        depths = np.frombuffer(tree.depths, dtype=np.uint16)
+        parents = np.frombuffer(tree.parents, dtype=np.int32)
+        review_nodes = np.flatnonzero(depths % 2 == (0 if book.user_color == chess.WHITE else 1))
+        review_nodes = review_nodes[review_nodes != ROOT]
+
+        self.book = book
+        self.nodes = review_nodes
+        self.review_times = np.frombuffer(tree.review_times, dtype=np.int64)[review_nodes]
+        self.intervals = np.frombuffer(tree.intervals, dtype=np.int32)[review_nodes]
+
+        # opening of each move: its ancestor at the given depth, found by climbing all moves at once
+        openings = review_nodes.copy()
+        while True:
+            deeper = depths[openings] > depth
+            if not deeper.any():
+                break
+            openings[deeper] = parents[openings[deeper]]
+        self.openings = openings
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def due_counts(self, now: datetime, horizon: timedelta, bucket: int):
+        """Moves due now (including the unscheduled ones) and the number falling due in each following bucket."""
+        start = int(now.timestamp())
+        end = start + int(horizon.total_seconds())
+        due_now = int(np.count_nonzero(self.review_times <= start))
+        upcoming = self.review_times[(self.review_times > start) & (self.review_times <= end)]
+        counts = np.bincount((upcoming - start - 1) // bucket, minlength=-(-(end - start) // bucket))
+        return due_now, counts
+
+    def interval_histogram(self):
+        scheduled = self.intervals[self.review_times != UNSCHEDULED]
+        bounds = [minutes for _, minutes in INTERVAL_BINS]
+        counts = np.bincount(np.searchsorted(bounds, scheduled, side='right'), minlength=len(bounds) + 1)
+        labels = [f"<{label}" for label, _ in INTERVAL_BINS] + [f">={INTERVAL_BINS[-1][0]}"]
+        return list(zip(labels, counts.tolist()))
+
+    def by_opening(self, now: datetime, horizon: timedelta):
+        """(opening node, moves, due now, due within horizon) per opening, sorted by decreasing workload."""
+        start = int(now.timestamp())
+        end = start + int(horizon.total_seconds())
+        openings, inverse = np.unique(self.openings, return_inverse=True)
+        total = np.bincount(inverse, minlength=len(openings))
+        due_now = np.bincount(inverse, weights=self.review_times <= start, minlength=len(openings))
+        due_soon = np.bincount(inverse, weights=self.review_times <= end, minlength=len(openings))
+        order = np.lexsort((-due_now, -due_soon))
+        return [(int(openings[i]), int(total[i]), int(due_now[i]), int(due_soon[i])) for i in order]
+
+
+def opening_name(book: ReviewBook, node: int) -> str:
+    moves = [unpack_move(m) for m in book.tree.path(node)]
+    return chess.Board().variation_san(moves) or "(start)"
+
+
+def report(book: ReviewBook, now: datetime, horizon: timedelta, bucket: str, depth: int, top: int) -> str:
+    arrays = ReviewArrays(book, depth)
+    due_now, counts = arrays.due_counts(now, horizon, BUCKETS[bucket])
+    backlog = due_now + np.cumsum(counts)  # if no moves were reviewed in the meantime
+    lines = [f"{len(arrays)} user moves, {due_now} due now"]
+    lines.append(f"due per {bucket} (cumulative backlog):")
+    for i, (count, total) in enumerate(zip(counts.tolist(), backlog.tolist())):
+        if count:
+            lines.append(f"  +{i + 1:3d} {bucket}: {count:6d} ({total})")
+    lines.append("intervals: " + " ".join(f"{label}:{count}" for label, count in arrays.interval_histogram()))
+    lines.append(f"openings (moves, due now, due within {horizon.days} days):")
+    for node, total, due, soon in arrays.by_opening(now, horizon)[:top]:
+        lines.append(f"  {opening_name(book, node)}: {total}, {due}, {soon}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forecast the review workload of the repertoire.")
+    parser.add_argument('--days', type=int, default=28, help="forecast horizon")
+    parser.add_argument('--bucket', choices=sorted(BUCKETS), default='day')
+    parser.add_argument('--depth', type=int, default=2, help="plies defining an opening")
+    parser.add_argument('--top', type=int, default=20, help="openings listed per color")
+    args = parser.parse_args()
+
+    topdir = Path().home() / '.repertition'
+    for color, name in ((chess.WHITE, 'white'), (chess.BLACK, 'black')):
+        book = ReviewBook(topdir / 'review' / (name + '.pgn'), topdir / 'repertoire' / name, color)
+        print(f"== {name} ==")
+        print(report(book, clk.now(), timedelta(days=args.days), args.bucket, args.depth, args.top))
+
+
+if __name__ == "__main__":
+    main()
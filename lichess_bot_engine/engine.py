@@ -2,6 +2,7 @@ import sys
 from typing import Any
 
 import chess
+import chess.engine
 from chess.engine import PlayResult
 
 from engine_wrapper import MinimalEngine
@@ -15,14 +16,17 @@ class Repertition(MinimalEngine):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         play.init()
+        self.session = play.Session()
+        chat.set_queued(True)  # don't wait for lichess to post chat messages before moving
 
     def quit(self):
+        chat.flush()
         play.cleanup()
         super().quit()
 
     def play_move(self, board, game, li, start_time, move_overhead, can_ponder, is_correspondence, correspondence_move_time, engine_cfg):
-        chat.set_send_func(lambda msg: li.chat(game.id, "player", msg))
+        self.session.send_func = lambda msg: li.chat(game.id, "player", msg)
         super().play_move(board, game, li, start_time, move_overhead, can_ponder, is_correspondence, correspondence_move_time, engine_cfg)
 
-    def search(self, board: chess.Board, *args: Any) -> PlayResult:
-        return PlayResult(play.next_move(board), None)
+    def search(self, board: chess.Board, time_limit: chess.engine.Limit = None, *args: Any) -> PlayResult:
+        return PlayResult(play.next_move(board, self.session, time_limit), None)
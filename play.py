@@ -1,20 +1,70 @@
 import os
 import sys
+import threading
 from pathlib import Path
 
 import chess
+import chess.engine
 
 import bridge
 import chat
-from review_book import ReviewBook
+import stats
+from review_book import ReviewBook, ReviewSummary
+from time_manager import TimeManager
 
 
-books = None
+# analyze the ends of all variations with the bridged engine in the background
+PRECOMPUTE_LEAVES = False
+
+# look for changed repertoire files at the start of each game, and apply them to the loaded books
+RELOAD_REPERTOIRE = True
+
+books = {}  # loaded on first use
+book_paths = {}  # color: (review PGN, repertoire directory)
+summaries = {}
+books_lock = threading.Lock()
+default_session = None
+stats_path = None
+users = 0
+init_lock = threading.Lock()
+
+
+class Session:
+    """State of one game. Several games can be played at once, sharing the books."""
+
+    def __init__(self, send_func=None):
+        self.send_func = send_func
+        self.cursors = {}
+        self.messages = []
+        self.time_manager = TimeManager()
+
+    def cursor(self, color):
+        if color not in self.cursors:
+            self.cursors[color] = book(color).open_session()
+        return self.cursors[color]
+
+    def send(self, msg):
+        self.messages.append(msg)
+
+    def flush(self):
+        # the messages of one move are delivered together
+        messages, self.messages = self.messages, []
+        chat.send_batch(messages, self.send_func)
 
 
 def init():
-    global books
+    # the books and engines are shared by all users (games) in this process
+    global users
+    with init_lock:
+        if not users:
+            _init()
+        users += 1
+
+
+def _init():
+    global default_session, stats_path
     topdir = Path().home() / '.repertition'
+    stats_path = topdir / 'stats.txt'
     repdir = topdir / 'repertoire'
     revdir = topdir / 'review'
     engine_path = topdir / 'engine'
@@ -22,40 +72,134 @@ def init():
     os.makedirs(revdir, exist_ok=True)
     os.makedirs(repdir / 'white', exist_ok=True)
     os.makedirs(repdir / 'black', exist_ok=True)
-    books = {chess.WHITE: ReviewBook(revdir / 'white.pgn', repdir / 'white', chess.WHITE),
-             chess.BLACK: ReviewBook(revdir / 'black.pgn', repdir / 'black', chess.BLACK)}
+    book_paths[chess.WHITE] = revdir / 'white.pgn', repdir / 'white'
+    book_paths[chess.BLACK] = revdir / 'black.pgn', repdir / 'black'
 
     if not engine_path.exists() or not os.access(engine_path, os.X_OK):
         sys.exit(f"Missing or not executable: {engine_path}")
-    bridge.init(engine_path)
+    bridge.init(engine_path, cache_path=topdir / 'engine_cache')
+    default_session = Session()
+
+
+def book(color) -> ReviewBook:
+    """The book of color, loaded on first use: a game only drills one color."""
+    with books_lock:
+        if color not in books:
+            books[color] = ReviewBook(*book_paths[color], color)
+            summaries.pop(color, None)
+            if PRECOMPUTE_LEAVES:
+                bridge.precompute(list(books[color].engine_leaves()))
+        return books[color]
+
+
+def review_counts(color):
+    """The book of color if it is loaded, else its summary if up to date (the book is loaded otherwise)."""
+    with books_lock:
+        if color in books:
+            return books[color]
+        if color not in summaries:
+            summaries[color] = ReviewSummary.load(*book_paths[color])
+        if summaries[color] is not None:
+            return summaries[color]
+    return book(color)
+
+
+def reload_books():
+    with books_lock:
+        loaded = list(books.values())
+        summaries.clear()  # validated again on next use
+    for loaded_book in loaded:
+        with loaded_book.lock:
+            try:
+                changed = loaded_book.reload()
+            except Exception as e:
+                # e.g. a file being written, or not a PGN: the game goes on with the current repertoire
+                print(f"Could not reload {loaded_book.input_dir}: {e!r}", file=sys.stderr)
+                continue
+            if changed and PRECOMPUTE_LEAVES:
+                bridge.precompute(list(loaded_book.engine_leaves()))
 
 
 def cleanup():
-    bridge.cleanup()
+    global users
+    with init_lock:
+        users -= 1
+        if users:
+            return
+        for loaded in books.values():
+            with loaded.lock:
+                loaded.compact()
+        bridge.cleanup()
+        stats.write(stats_path)
 
 
-def next_move(board: chess.Board) -> chess.Move:
+def next_move(board: chess.Board, session: Session = None, limit: chess.engine.Limit = None) -> chess.Move:
+    """The reply to the position of board; limit holds the clock and other "go" parameters of the GUI, if any."""
+    session = session or default_session
+    try:
+        with stats.move():
+            return _next_move(board, session, limit)
+    finally:
+        session.flush()
+
+
+@stats.timed('play.next_move')
+def _next_move(board: chess.Board, session: Session, limit: chess.engine.Limit) -> chess.Move:
     if len(board.move_stack) < 2:
-        report_review_status()
+        session.time_manager = TimeManager()
+        if RELOAD_REPERTOIRE:
+            reload_books()
+        report_review_status(session)
 
     user_color = not board.turn
-    move, bottom_reached, correct_move = books[user_color].next_move(board)
+    user_book = book(user_color)
+    with user_book.lock:
+        move, bottom_reached, correct_move = user_book.next_move(board, session.cursor(user_color))
     if bottom_reached:
-        chat.send("You reached the end of this variation, congratulations!")
-        report_review_status()
+        session.send("You reached the end of this variation, congratulations!")
+        report_review_status(session)
     if correct_move:
-        chat.send("Sorry, that's not the move!")
-        chat.send(f"Correct move: {correct_move}")
+        session.send("Sorry, that's not the move!")
+        session.send(f"Correct move: {correct_move}")
+    if move:
+        session.time_manager.book_move(board, limit)
+    else:
+        move = bridge.next_move(board, session.time_manager.engine_limit(board, limit))
+    return move
+
+
+def ponder(board: chess.Board, session: Session = None, limit: chess.engine.Limit = None) -> chess.Move:
+    """
+    Prepares the reply to the position of board (in which the user has played the expected move) while the
+    user is thinking: nothing is updated, but searches of the bridged engine are started and cached.
+    """
+    session = session or default_session
+    user_color = not board.turn
+    user_book = book(user_color)
+    with user_book.lock:
+        move = user_book.peek_move(board, session.cursor(user_color))
     if not move:
-        move = bridge.next_move(board)
+        move = bridge.next_move(board, session.time_manager.engine_limit(board, limit, spend=False))
     return move
 
 
-def report_review_status():
-    pending_white = books[chess.WHITE].pending_review_count()
-    pending_black = books[chess.BLACK].pending_review_count()
+def ponder_move(board: chess.Board, move: chess.Move, session: Session = None):
+    session = session or default_session
+    user_book = book(not board.turn)
+    with user_book.lock:
+        return user_book.expected_user_move(board, move, session.cursor(not board.turn))
+
+
+def report_review_status(session: Session = None):
+    session = session or default_session
+    pending = {}
+    for color in (chess.WHITE, chess.BLACK):
+        counts = review_counts(color)
+        with counts.lock:
+            pending[color] = counts.pending_review_count()
+    pending_white, pending_black = pending[chess.WHITE], pending[chess.BLACK]
     if (pending_white + pending_black) == 0:
-        chat.send("No moves left to review, congratulations!")
+        session.send("No moves left to review, congratulations!")
     else:
-        chat.send(f"{pending_white} moves to review as white.")
-        chat.send(f"{pending_black} moves to review as black.")
+        session.send(f"{pending_white} moves to review as white.")
+        session.send(f"{pending_black} moves to review as black.")
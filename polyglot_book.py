@@ -0,0 +1,69 @@
+import os
+import sys
+from pathlib import Path
+from typing import Optional
+
+import chess
+import chess.polyglot
+
+import clk
+from review_book import ReviewBook, walk_positions
+
+
+def encode_move(board: chess.Board, move: chess.Move) -> int:
+    to_square = move.to_square
+    if board.is_castling(move):
+        # polyglot encodes castling as the king capturing its own rook
+        to_square = chess.square(7 if chess.square_file(move.to_square) > chess.square_file(move.from_square) else 0,
+                                 chess.square_rank(move.from_square))
+    promotion = move.promotion - 1 if move.promotion else 0
+    return to_square | move.from_square << 6 | promotion << 12
+
+
+def export(book: ReviewBook, path: Path) -> int:
+    """
+    Writes the book as a polyglot opening book. Positions where the user is to move only get the main move.
+    For the other positions, the learn field of each move holds the lowest review time of its subtree
+    (in minutes since the epoch), which is what ReviewBook.next_move uses to choose the move.
+    """
+    now = clk.now()
+    entries = {}
+    for node, board in walk_positions(book.tree):
+        key = chess.polyglot.zobrist_hash(board)
+        variations = book.tree.children(node)
+        if board.turn == book.user_color:
+            variations = variations[:1]
+        for v in variations:
+            rt = book._subtree_review_time(v, now)
+            learn = int(rt.timestamp() // 60) if rt else 0
+            raw_move = encode_move(board, book.tree.move(v))
+            if (key, raw_move) not in entries or learn < entries[key, raw_move]:
+                entries[key, raw_move] = learn  # transpositions: keep the lowest review time
+
+    os.makedirs(path.parent, exist_ok=True)
+    with open(path, 'wb') as f:
+        for (key, raw_move), learn in sorted(entries.items(), key=lambda e: (e[0][0], e[1])):
+            f.write(chess.polyglot.ENTRY_STRUCT.pack(key, raw_move, 1, learn))
+    return len(entries)
+
+
+class PolyglotBook:
+    """Read-only lookups in an exported book, memory-mapped and searched by binary search."""
+
+    def __init__(self, path: Path):
+        self.reader = chess.polyglot.open_reader(path)
+
+    def next_move(self, board: chess.Board) -> Optional[chess.Move]:
+        entry = min(self.reader.find_all(board), key=lambda e: e.learn, default=None)
+        return entry.move if entry else None
+
+    def close(self):
+        self.reader.close()
+
+
+if __name__ == "__main__":
+    topdir = Path().home() / '.repertition'
+    for color, name in ((chess.WHITE, 'white'), (chess.BLACK, 'black')):
+        book = ReviewBook(topdir / 'review' / (name + '.pgn'), topdir / 'repertoire' / name, color)
+        count = export(book, topdir / 'polyglot' / (name + '.bin'))
+        print(f"{name}: {count} entries written to {topdir / 'polyglot' / (name + '.bin')}", file=sys.stderr)
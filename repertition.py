@@ -1,12 +1,14 @@
+import asyncio
+
 import chess
 import play
-from communication import talk
+from communication import talk_async
 
 
 if __name__ == "__main__":
     play.init()
     try:
-        talk(chess.Board(), play.next_move)
+        asyncio.run(talk_async(chess.Board(), play.next_move, play.ponder, play.ponder_move))
     except KeyboardInterrupt:
         pass
     play.cleanup()
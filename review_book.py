@@ -1,22 +1,50 @@
+import bisect
+import bz2
+import concurrent.futures
+import gzip
+import marshal
+import multiprocessing
 import os
 import re
 import shutil
 import sys
+import threading
 import typing
+from array import array
 
 import chess
 import chess.pgn
+import chess.polyglot
 
 import clk
 import review_config
+import review_db
+import stats
+import tree_cache
+from book_tree import NONE, ROOT, UNSCHEDULED, BookTree, pack_move, unpack_move
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Callable, Optional
+from typing import Callable, List, Optional, Tuple
 
 
 REVIEW_REGEX = re.compile(r"""(?P<prefix>\s?)\[%review\s(?P<isotime>[^]]+)\](?P<suffix>\s?)""")
 INTERVAL_REGEX = re.compile(r"""(?P<prefix>\s?)\[%interval\s(?P<days>\d+)\+(?P<hours>\d+):(?P<minutes>\d+)\](?P<suffix>\s?)""")
+INTERVAL_VALUE_REGEX = re.compile(r"""(?P<days>\d+)\+(?P<hours>\d+):(?P<minutes>\d+)""")
+
+# subtree_earliest value of subtrees without scheduled moves
+NO_REVIEW = (1 << 63) - 1
+
+# the journal is compacted into the review PGN when it grows beyond this size (in bytes)
+JOURNAL_COMPACT_SIZE = 1024 * 1024
+
+SUMMARY_VERSION = 1
+
+# repertoire files, possibly compressed
+INPUT_PATTERNS = ('**/*.pgn', '**/*.pgn.gz', '**/*.pgn.bz2')
+
+# repertoire files are parsed in a process pool when there are at least this many
+PARALLEL_PARSE_MIN_FILES = 8
 
 
 # copied from python-chess
@@ -29,6 +57,145 @@ def _condense_affix(infix: str) -> Callable[[typing.Match[str]], str]:
     return repl
 
 
+def _format_interval(interval: timedelta) -> str:
+    hours = int(interval.seconds // 3600)
+    minutes = int(interval.seconds % 3600 // 60)
+    return f"{interval.days:d}+{hours:d}:{minutes:02d}"
+
+
+def _parse_interval(match: typing.Match[str]) -> timedelta:
+    return timedelta(days=int(match.group("days")), hours=int(match.group("hours")), minutes=int(match.group("minutes")))
+
+
+def _input_paths(input_dir: Path) -> List[Path]:
+    return sorted(path for pattern in INPUT_PATTERNS for path in input_dir.glob(pattern))
+
+
+def _open_pgn(pgn_path: Path) -> typing.TextIO:
+    if pgn_path.suffix == '.gz':
+        return gzip.open(pgn_path, 'rt', encoding='utf-8')
+    if pgn_path.suffix == '.bz2':
+        return bz2.open(pgn_path, 'rt', encoding='utf-8')
+    return open(pgn_path, encoding='utf-8')
+
+
+def _read_move_tree(pgn_path: Path) -> Tuple[bytes, bytes]:
+    # runs in a worker process: returns the packed moves and the number of children of each node in preorder,
+    # which are much cheaper to send back (and to keep) than GameNode objects
+    tree = BookTree()
+    with _open_pgn(pgn_path) as pgn:
+        # games are merged one at a time as they are read, so only one is held in memory
+        while True:
+            game = chess.pgn.read_game(pgn)
+            if game is None:
+                break
+            if "FEN" in game.headers and game.board().epd() != chess.Board().epd():
+                continue  # the tree only has variations from the starting position
+            stack = [(game, ROOT)]
+            while stack:
+                game_node, node = stack.pop()
+                for v in game_node.variations:
+                    packed_move = pack_move(v.move)
+                    child = tree.child(node, packed_move)
+                    if child is None:
+                        child = tree.add_child(node, packed_move)
+                    stack.append((v, child))
+
+    moves, counts = array('H'), array('H')
+    for node in tree.preorder():
+        moves.append(tree.moves[node])
+        counts.append(len(tree.children(node)))
+    return moves.tobytes(), counts.tobytes()
+
+
+def _merge_move_tree(tree: BookTree, move_tree: Tuple[bytes, bytes], user_color=None):
+    """
+    Adds the moves of a file (as returned by _read_move_tree) to tree. Where user_color is to move and the
+    tree already has a move, the other moves of the file are skipped (only the main move will be accepted).
+    """
+    moves, counts = array('H'), array('H')
+    moves.frombytes(move_tree[0])
+    counts.frombytes(move_tree[1])
+    stack = [[ROOT, counts[0], False]]  # destination node, children left to read, skipping them
+    for i in range(1, len(moves)):
+        while not stack[-1][1]:
+            stack.pop()
+        parent = stack[-1]
+        parent[1] -= 1
+        node, skipping = parent[0], parent[2]
+        if not skipping:
+            child = tree.child(node, moves[i])
+            if child is None:
+                if tree.turn(node) == user_color and tree.has_children(node):
+                    parent[2] = skipping = True
+                else:
+                    child = tree.add_child(node, moves[i])
+        stack.append([None if skipping else child, counts[i], skipping])
+
+
+def _timestamp(dt: datetime) -> int:
+    return int(dt.timestamp())
+
+
+def _datetime(timestamp: int) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def walk_positions(tree: BookTree):
+    """Yields (node, board) for all nodes in preorder. The same board is updated in place for every node."""
+    board = chess.Board()
+    stack = [(ROOT, False)]
+    while stack:
+        node, visited = stack.pop()
+        if visited:
+            board.pop()
+            continue
+        if node != ROOT:
+            board.push(tree.move(node))
+            stack.append((node, True))
+        yield node, board
+        stack.extend((child, False) for child in reversed(tree.children(node)))
+
+
+def read_review_pgn(pgn_file) -> BookTree:
+    """Reads a review PGN (the comments of its moves hold the review annotations)."""
+    game = chess.pgn.read_game(pgn_file) or chess.pgn.Game()
+    tree = BookTree(game.headers)
+    stack = [(game, ROOT)]
+    while stack:
+        game_node, node = stack.pop()
+        rn = ReviewNode(game_node)
+        review_time, interval = rn.review_time(), rn.interval()
+        if review_time is not None:
+            tree.review_times[node] = _timestamp(review_time)
+        if interval is not None:
+            tree.intervals[node] = int(interval.total_seconds() // 60)
+        rn.set_review_time(None)
+        rn.set_interval(None)
+        if game_node.comment:
+            tree.comments[node] = game_node.comment
+        for v in game_node.variations:
+            stack.append((v, tree.add_child(node, pack_move(v.move))))
+    return tree
+
+
+def to_game(tree: BookTree) -> chess.pgn.Game:
+    """The tree as a PGN game, with the review annotations in the comments."""
+    game = chess.pgn.Game(tree.headers) if tree.headers else chess.pgn.Game()
+    stack = [(ROOT, game)]
+    while stack:
+        node, game_node = stack.pop()
+        game_node.comment = tree.comments.get(node, "")
+        rn = ReviewNode(game_node)
+        if tree.review_times[node] != UNSCHEDULED:
+            rn.set_review_time(_datetime(tree.review_times[node]))
+        if tree.intervals[node] != NONE:
+            rn.set_interval(timedelta(minutes=tree.intervals[node]))
+        for child in tree.children(node):
+            stack.append((child, chess.pgn.ChildNode(game_node, tree.move(child))))
+    return game
+
+
 class ReviewNode:
     def __init__(self, node):
         self.node = node
@@ -55,14 +222,12 @@ class ReviewNode:
         match = INTERVAL_REGEX.search(self.node.comment)
         if match is None:
             return None
-        return timedelta(days=int(match.group("days")), hours=int(match.group("hours")), minutes=int(match.group("minutes")))
+        return _parse_interval(match)
 
     def set_interval(self, interval: Optional[timedelta]) -> None:
         annotation = ""
         if interval is not None:
-            hours = int(interval.seconds // 3600)
-            minutes = int(interval.seconds % 3600 // 60)
-            annotation = f"[%interval {interval.days:d}+{hours:d}:{minutes:02d}]"
+            annotation = f"[%interval {_format_interval(interval)}]"
 
         self.node.comment, found = INTERVAL_REGEX.subn(_condense_affix(annotation), self.node.comment, count=1)
 
@@ -72,95 +237,353 @@ class ReviewNode:
             self.node.comment += annotation
 
 
-class ReviewBook:
+class ReviewIndex:
+    """Review times of all user moves (as timestamps), kept sorted to count due moves by binary search."""
+
+    def __init__(self, times=()):
+        self.times = array('q', sorted(times))
+
+    def __len__(self):
+        return len(self.times)
+
+    def replace(self, old: int, new: int) -> None:
+        del self.times[bisect.bisect_left(self.times, old)]
+        bisect.insort(self.times, new)
+
+    def count_until(self, timestamp: int) -> int:
+        return bisect.bisect_right(self.times, timestamp)
+
+    def first(self) -> Optional[int]:
+        return self.times[0] if self.times else None
+
+
+class ReviewCursor:
+    """Position of a game in a ReviewBook, advanced move by move instead of looked up from the root."""
+
+    def __init__(self, book, board: Optional[chess.Board] = None):
+        self.book = book
+        self.reset(ROOT)
+        if board is not None:
+            self.sync(board)
+
+    def reset(self, start: Optional[int]):
+        self.node, self.previous, self.moves = start, None, []
+        self.generation = self.book.generation
+
+    def jump(self, node: int):
+        self.node, self.previous = node, None
+
+    def advance(self, move: chess.Move):
+        self.moves.append(move)
+        if self.node is None:
+            self.previous = None
+        else:
+            self.node, self.previous = self.book.tree.child(self.node, pack_move(move)), self.node
+
+    @stats.timed('book.find_node')
+    def sync(self, board: chess.Board):
+        stack = board.move_stack
+        n = len(self.moves)
+        if not n or stack[:n] != self.moves or self.generation != self.book.generation:
+            # new game, history diverged (takeback, ...) or book reloaded
+            # (moves taken from the stack compare by identity, so the comparison is cheap)
+            self.reset(self.book.start_node(board))
+            n = 0
+        for move in stack[n:]:
+            self.advance(move)
+
+
+class ReviewCounts:
+    """Due counts from self.index (a ReviewIndex or a ReviewDatabase)."""
+
+    @stats.timed('book.pending_review_count')
+    def pending_review_count(self, within: timedelta = timedelta()) -> int:
+        return self.index.count_until(_timestamp(clk.now() + within))
+
+    def next_review_time(self) -> Optional[datetime]:
+        first = self.index.first()
+        if first is None:
+            return None
+        if first == UNSCHEDULED:
+            return clk.now()
+        return _datetime(first)
+
+
+class ReviewSummary(ReviewCounts):
+    """
+    Due counts of a book without loading it, from the review times written by its last compaction
+    (or from its database with the sqlite storage).
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.lock = threading.RLock()
+
+    @classmethod
+    def load(cls, path: Path, input_dir: Path) -> Optional['ReviewSummary']:
+        """None if there is no summary or if the book changed since it was written."""
+        if review_config.STORAGE != 'sqlite' and _journal_path(path).exists():
+            return None  # reviews since the last compaction
+        try:
+            with open(_summary_path(path), 'rb') as f:
+                version, signature, times = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if version != SUMMARY_VERSION:
+            return None
+        paths = _input_paths(input_dir)
+        if review_config.STORAGE != 'sqlite':
+            paths.append(path)
+        if not tree_cache.same_content(tree_cache.file_signature(paths, signature), signature):
+            return None
+        if review_config.STORAGE == 'sqlite':
+            return cls(review_db.ReviewDatabase(path.with_suffix('.sqlite')))
+        index = ReviewIndex()
+        index.times.frombytes(times)
+        return cls(index)
+
+
+def _journal_path(path: Path) -> Path:
+    return path.with_name(path.name + '.journal')
+
+
+def _summary_path(path: Path) -> Path:
+    return path.with_name(path.name + '.summary')
+
+
+class ReviewBook(ReviewCounts):
     def __init__(self, path: Path, input_dir: Path, user_color):
         self.path = path
+        self.journal_path = _journal_path(path)
+        self.cache_path = path.with_name(path.name + '.cache')
+        self.summary_path = _summary_path(path)
         self.user_color = user_color
-        self.tree = chess.pgn.Game()
-        self.deleted_moves = 0
+        self.tree = BookTree()
+        self.deleted_moves = 0  # by the last update from the repertoire files
+        self.added_moves = 0
+        self.lock = threading.RLock()  # for callers sharing the book between threads
+        self.persistent = True  # when False, reviews only update the tree in memory (simulations)
+        self.input_dir = input_dir
+        self.input_paths = _input_paths(input_dir)
+        self.files = {}  # moves of each input file, as returned by _read_move_tree
+        self.generation = 0  # incremented when node numbers change
+        self.db = None
+        if review_config.STORAGE == 'sqlite':
+            self.db = review_db.ReviewDatabase(path.with_suffix('.sqlite'))
+        # a new database is filled from the review PGN, if any
+        import_pgn = self.db is not None and not len(self.db) and self.path.exists()
+
+        cached = None if import_pgn else tree_cache.load(self.cache_path)
+        if cached:
+            cached_signature, encoded, self.files = cached
+            self.signature = tree_cache.file_signature(self._signature_paths(), cached_signature)
+            unchanged = tree_cache.same_content(self.signature, cached_signature)
+            if unchanged or self._same_reviews(self.signature, cached_signature):
+                self.tree = tree_cache.decode(encoded)
+                if self.db is None:
+                    self._replay_journal(self.tree)
+                else:
+                    self._load_reviews()
+                if unchanged:
+                    self._build_index()
+                    return
+                # only repertoire files changed: the cached moves of the other files are reused
+                self.signature = cached_signature
+                if not self.reload():
+                    self._build_index()
+                return
+        else:
+            self.signature = []
 
-        for pgn_path in sorted(input_dir.glob('**/*.pgn')):
-            self._merge_pgn(pgn_path)
+        self._merge_pgns(self.input_paths)
 
-        if self.path.exists():
+        if self.db is not None and not import_pgn:
+            self._load_reviews()
+        elif self.path.exists():
             with open(self.path, encoding='utf-8') as pgn:
-                review_tree = chess.pgn.read_game(pgn)
+                review_tree = read_review_pgn(pgn)
+            self._replay_journal(review_tree)
             self._update_review_node(review_tree, self.tree)
-            self.tree = review_tree
+            self.tree = review_tree.compacted()
+            self._report_changes()
             if self.deleted_moves:
                 self._create_backup()
-
-        self._save()
-
-    def next_move(self, board: chess.Board):
+            if self.db is not None:
+                self.db.update((key, self.tree.review_times[node], self.tree.intervals[node])
+                               for node, key in self._review_node_keys())
+
+        self.compact()
+        self._build_index()
+
+    @stats.timed('book.compact')
+    def compact(self):
+        if self.db is None:
+            self._save()
+        if self.journal_path.exists():
+            os.remove(self.journal_path)
+        self.signature = tree_cache.file_signature(self._signature_paths(), self.signature)
+        tree_cache.save(self.cache_path, self.signature, self.tree, self.files)
+        self._save_summary()
+
+    def export_pgn(self, path: Path):
+        """Writes the tree with its review annotations, i.e. the review PGN."""
+        with open(path, 'w', encoding='utf-8') as pgn:
+            print(to_game(self.tree), file=pgn, end="\n\n")
+
+    def open_session(self, board: Optional[chess.Board] = None) -> ReviewCursor:
+        return ReviewCursor(self, board)
+
+    def review_time(self, node: int) -> Optional[datetime]:
+        timestamp = self.tree.review_times[node]
+        return None if timestamp == UNSCHEDULED else _datetime(timestamp)
+
+    def interval(self, node: int) -> Optional[timedelta]:
+        minutes = self.tree.intervals[node]
+        return None if minutes == NONE else timedelta(minutes=minutes)
+
+    def next_move(self, board: chess.Board, session: Optional[ReviewCursor] = None):
         move, bottom_reached, correct_move = None, False, None
-        node, previous = self._find_node(board)
-        if node:
-            if previous and previous is not self.tree:
+        session = session or self.session
+        session.sync(board)
+        node, previous = session.node, session.previous
+        if node is None and review_config.TRANSPOSITIONS:
+            node = self.find_position(board)
+            if node is not None:
+                session.jump(node)
+                previous = None
+        tree = self.tree
+        if node is not None:
+            if previous is not None and previous != ROOT:
                 self._update(previous, True)
-            variation, _, _ = self._find_lowest_review_time(node)
-            bottom_reached = not variation or not variation.variations
-            if variation:
-                move = variation.move
+            variation = self._find_lowest_review_time(node)
+            bottom_reached = variation is None or not tree.has_children(variation)
+            if variation is not None:
+                move = tree.move(variation)
                 if bottom_reached:
                     self._update(variation, True)
-        elif previous:
-            if previous is not self.tree:
-                self._update(previous, not previous.variations)
-            if previous.variations:
-                correct_move = previous.variations[0].san()
+        elif previous is not None:
+            if previous != ROOT:
+                self._update(previous, not tree.has_children(previous))
+            main = tree.main_child(previous)
+            if main is not None:
+                before = board.copy(stack=1)
+                before.pop()
+                correct_move = before.san(tree.move(main))
         return move, bottom_reached, correct_move
 
-    def pending_review_count(self):
-        count = 0
-        now = clk.now()
-        def visit(review_node):
-            nonlocal count, now
-            rt = review_node.review_time()
-            if not rt or rt <= now:
-                count += 1
-        self._walk_review_nodes(self.tree, visit)
-        return count
-
-    def _walk_review_nodes(self, base, func):
-        for v in base.variations:
-            if v.turn() == self.user_color:
-                func(ReviewNode(v))
-            self._walk_review_nodes(v, func)
-
-    def _find_lowest_review_time(self, base):
-        variation, node, review_time = None, None, None
-        for v in base.variations:
-            rt = ReviewNode(v).review_time()
-            if not rt:
-                rt = clk.now()
-            if not review_time or rt < review_time:
-                variation, node, review_time = v, v, rt
-            if v.variations:
-                _, n, rt = self._find_lowest_review_time(v.variations[0])
-                if rt and (not review_time or rt < review_time):
-                    variation, node, review_time = v, n, rt
-        return variation, node, review_time
+    def peek_move(self, board: chess.Board, session: Optional[ReviewCursor] = None) -> Optional[chess.Move]:
+        """The move next_move would play, without updating any review data."""
+        session = session or self.session
+        session.sync(board)
+        node = session.node
+        if node is None and review_config.TRANSPOSITIONS:
+            node = self.find_position(board)
+        variation = self._find_lowest_review_time(node) if node is not None else None
+        return self.tree.move(variation) if variation is not None else None
+
+    def expected_user_move(self, board: chess.Board, move: chess.Move,
+                           session: Optional[ReviewCursor] = None) -> Optional[chess.Move]:
+        """The main user move after playing move in the position of board."""
+        session = session or self.session
+        session.sync(board)
+        if session.node is None:
+            return None
+        node = self.tree.child(session.node, pack_move(move))
+        main = self.tree.main_child(node) if node is not None else None
+        return self.tree.move(main) if main is not None else None
+
+    def start_node(self, board: chess.Board) -> Optional[int]:
+        root = board.root()
+        if root.epd() == self.start_epd:
+            return ROOT
+        return self.find_position(root)
+
+    def find_position(self, board: chess.Board) -> Optional[int]:
+        if self.positions is None:
+            self._build_position_index()
+        nodes = self.positions.get(chess.polyglot.zobrist_hash(board))
+        return nodes[0] if nodes else None
+
+    def engine_leaves(self):
+        """Yields the positions at the end of variations where the engine is to move, i.e. those passed to the bridged engine."""
+        for node, board in walk_positions(self.tree):
+            if not self.tree.has_children(node) and board.turn != self.user_color:
+                yield board.copy(stack=False)
+
+    def _is_review_node(self, node: int) -> bool:
+        # review times are kept on the opponent moves, i.e. the positions where the user is to move
+        return node != ROOT and self.tree.turn(node) == self.user_color
+
+    def _build_index(self):
+        tree = self.tree
+        if self.db is not None:
+            self.index = self.db  # due moves are counted by the database
+        else:
+            self.index = ReviewIndex(tree.review_times[node] for node in range(1, len(tree)) if self._is_review_node(node))
+        # Lowest review time reachable from each node, as the earliest scheduled time (NO_REVIEW if none)
+        # and whether any move is unscheduled (those count as "now", so they are resolved in _subtree_review_time).
+        self.subtree_earliest = array('q', [NO_REVIEW]) * len(tree)
+        self.subtree_unscheduled = array('b', [0]) * len(tree)
+        for node in range(len(tree) - 1, -1, -1):  # children are numbered after their parents
+            self._update_subtree_time(node)
+        self.start_epd = chess.Board().epd()
+        self.positions = None  # built on first use
+        self.session = ReviewCursor(self)
+
+    def _build_position_index(self):
+        self.positions = {}
+        for node, board in walk_positions(self.tree):
+            self.positions.setdefault(chess.polyglot.zobrist_hash(board), []).append(node)
+
+    def _update_subtree_time(self, node: int):
+        tree = self.tree
+        earliest, unscheduled = NO_REVIEW, False
+        if self._is_review_node(node):
+            review_time = tree.review_times[node]
+            if review_time == UNSCHEDULED:
+                unscheduled = True
+            else:
+                earliest = review_time
+        child = tree.first_children[node]
+        # only the main user move is followed, as only that one is accepted
+        follow_siblings = tree.turn(node) != self.user_color
+        while child != NONE:
+            earliest = min(earliest, self.subtree_earliest[child])
+            unscheduled = unscheduled or self.subtree_unscheduled[child]
+            child = tree.next_siblings[child] if follow_siblings else NONE
+        self.subtree_earliest[node] = earliest
+        self.subtree_unscheduled[node] = unscheduled
+
+    def _subtree_review_time(self, node: int, now: datetime) -> Optional[datetime]:
+        earliest = self.subtree_earliest[node]
+        if self.subtree_unscheduled[node] and _timestamp(now) < earliest:
+            return now
+        return None if earliest == NO_REVIEW else _datetime(earliest)
+
+    @stats.timed('book.find_lowest_review_time')
+    def _find_lowest_review_time(self, base: int) -> Optional[int]:
+        now = _timestamp(clk.now())
+        tree, subtree_earliest, subtree_unscheduled = self.tree, self.subtree_earliest, self.subtree_unscheduled
+        variation, review_time = None, NO_REVIEW
+        child = tree.first_children[base]
+        while child != NONE:
+            rt = subtree_earliest[child]
+            if subtree_unscheduled[child] and now < rt:
+                rt = now
+            if rt < review_time:
+                variation, review_time = child, rt
+            child = tree.next_siblings[child]
+        return variation
 
     def _find_node(self, board: chess.Board):
-        previous = None
-        try:
-            node = self.tree
-            for move in board.move_stack:
-                previous = node
-                node = node.variation(move)
-            return node, previous
-        except KeyError:
-            if previous.ply() != board.ply() - 1:
-                previous = None
-            return None, previous
+        cursor = ReviewCursor(self, board)
+        return cursor.node, cursor.previous
 
-    def _update(self, node, correct):
+    def _update(self, node: int, correct: bool):
         now = clk.now()
-        rn = ReviewNode(node)
         if correct:
-            review_time = rn.review_time()
-            interval = rn.interval()
+            review_time = self.review_time(node)
+            interval = self.interval(node)
         else:
             review_time = None
             interval = None
@@ -175,44 +598,216 @@ class ReviewBook:
                 interval *= review_config.INTERVAL_INC_FACTOR
                 if interval > review_config.MAX_INTERVAL:
                     interval = review_config.MAX_INTERVAL
-        rn.set_review_time(review_time)
-        rn.set_interval(interval)
-        self._save()
-
-    def _merge_pgn(self, pgn_path: Path):
-        with open(pgn_path, encoding='utf-8') as pgn:
-            input_pgn = chess.pgn.read_game(pgn)
-        self._merge_node(self.tree, input_pgn)
-
-    def _merge_node(self, dst_node, src_node):
-        for src_variation in src_node:
-            try:
-                dst_variation = dst_node.variation(src_variation.move)
-            except KeyError:
-                if dst_node.turn() == self.user_color and dst_node.variations:
-                    return  # skip alternative user moves (only main move will be accepted)
-                dst_variation = dst_node.add_variation(src_variation.move)
-            self._merge_node(dst_variation, src_variation)
-
-    def _update_review_node(self, dst_node, src_node):
-        for dst_variation in dst_node:
-            if not src_node.has_variation(dst_variation.move):
-                dst_node.remove_variation(dst_variation.move)
-                self.deleted_moves += 1
-        for src_variation in src_node:
-            try:
-                dst_variation = dst_node.variation(src_variation.move)
-            except KeyError:
-                dst_variation = dst_node.add_variation(src_variation.move)
-            self._update_review_node(dst_variation, src_variation)
-
+        tree = self.tree
+        old_review_time = tree.review_times[node]
+        tree.review_times[node] = _timestamp(review_time)
+        tree.intervals[node] = int(interval.total_seconds() // 60)
+        ancestor = node
+        while ancestor != NONE:
+            self._update_subtree_time(ancestor)
+            ancestor = tree.parents[ancestor]
+        if self.db is not None:
+            if self.persistent:
+                self.db.set(self._path_key(node), tree.review_times[node], tree.intervals[node])
+            return
+        if self._is_review_node(node):
+            self.index.replace(old_review_time, tree.review_times[node])
+        if self.persistent:
+            self._append_journal(node)
+
+    @stats.timed('book.append_journal')
+    def _append_journal(self, node: int):
+        record = self._path_key(node) + "\t" + self.review_time(node).isoformat() + "\t" + _format_interval(self.interval(node))
+        with open(self.journal_path, 'a', encoding='utf-8') as journal:
+            print(record, file=journal)
+            size = journal.tell()
+        if size > JOURNAL_COMPACT_SIZE:
+            self.compact()
+
+    def _path_key(self, node: int) -> str:
+        # key of the move in the journal and in the database
+        return " ".join(unpack_move(m).uci() for m in self.tree.path(node))
+
+    def _review_node_keys(self):
+        """Yields (node, path key) for all review nodes."""
+        stack = [(ROOT, "")]
+        while stack:
+            node, key = stack.pop()
+            if self._is_review_node(node):
+                yield node, key
+            for child in self.tree.children(node):
+                uci = self.tree.move(child).uci()
+                stack.append((child, key + " " + uci if key else uci))
+
+    def _load_reviews(self):
+        # applies the database to the tree: rows of moves no longer in the repertoire are deleted,
+        # and new moves get unscheduled rows
+        tree = self.tree
+        rows = {key: (review_time, interval) for key, review_time, interval in self.db.rows()}
+        new_rows = []
+        for node, key in self._review_node_keys():
+            row = rows.pop(key, None)
+            if row is None:
+                row = UNSCHEDULED, NONE
+                new_rows.append((key,) + row)
+            tree.review_times[node], tree.intervals[node] = row
+        if rows and not self.deleted_moves:  # otherwise the backup was made when the moves were deleted
+            self.deleted_moves = len(rows)
+            self._report_changes()
+            self._create_backup()
+        if new_rows or rows:
+            self.db.update(new_rows, deleted=rows)
+
+    def _save_summary(self):
+        tree = self.tree
+        times = ReviewIndex(tree.review_times[node] for node in range(1, len(tree)) if self._is_review_node(node)).times
+        tmp_path = self.summary_path.with_name(self.summary_path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            marshal.dump((SUMMARY_VERSION, self.signature, times.tobytes()), f)
+        os.replace(tmp_path, self.summary_path)
+
+    def _signature_paths(self):
+        # the tree cache depends on the review PGN only when that holds the review times
+        return self.input_paths + ([] if self.db is not None else [self.path])
+
+    def _replay_journal(self, tree: BookTree):
+        if not self.journal_path.exists():
+            return
+        with open(self.journal_path, encoding='utf-8') as journal:
+            for line in journal:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) != 3:
+                    continue  # incomplete record, e.g. after a crash
+                interval = INTERVAL_VALUE_REGEX.fullmatch(fields[2])
+                if interval is None:
+                    continue
+                try:
+                    node = tree.find(pack_move(chess.Move.from_uci(uci)) for uci in fields[0].split())
+                    review_time = datetime.fromisoformat(fields[1])
+                except ValueError:
+                    continue
+                if node is None:
+                    continue
+                tree.review_times[node] = _timestamp(review_time)
+                tree.intervals[node] = int(_parse_interval(interval).total_seconds() // 60)
+
+    def _merge_pgns(self, pgn_paths):
+        self.files.update(self._read_files(pgn_paths))
+        self.tree = self._merged_tree()
+
+    def _read_files(self, pgn_paths) -> dict:
+        files = {}
+        if len(pgn_paths) >= PARALLEL_PARSE_MIN_FILES and (os.cpu_count() or 1) > 1:
+            # not forked: the engine, chat and precompute threads may be running
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            with concurrent.futures.ProcessPoolExecutor(mp_context=multiprocessing.get_context(start_method)) as pool:
+                for pgn_path, move_tree in zip(pgn_paths, pool.map(_read_move_tree, pgn_paths)):
+                    files[str(pgn_path)] = move_tree
+        else:
+            for pgn_path in pgn_paths:
+                files[str(pgn_path)] = _read_move_tree(pgn_path)
+        return files
+
+    def _merged_tree(self) -> BookTree:
+        # files are merged in order, as the first file wins for user moves
+        tree = BookTree()
+        for pgn_path in self.input_paths:
+            _merge_move_tree(tree, self.files[str(pgn_path)], self.user_color)
+        return tree
+
+    @stats.timed('book.reload')
+    def reload(self) -> bool:
+        """
+        Applies the changes of the repertoire files since they were read to the tree, keeping the review times.
+        Only changed files are parsed, and only the subtrees of their moves are compared. Returns whether anything changed.
+        self.signature must be that of the files in self.files. If a file can't be read, the book is left unchanged.
+        """
+        input_paths = _input_paths(self.input_dir)
+        known = [entry for entry in self.signature if entry[0] in self.files]
+        signature = tree_cache.file_signature(input_paths, known)
+        old, new = ({entry[0]: entry[1:] for entry in s} for s in (known, signature))
+        changed = [p for p in sorted(set(old) | set(new))
+                   if p not in old or p not in new or old[p][0] != new[p][0] or old[p][2] != new[p][2]]
+        if not changed:
+            return False
+
+        read = self._read_files([Path(p) for p in changed if p in new])
+
+        # the moves that may have been added or removed: those of the old and new versions of the changed files
+        touched = BookTree()
+        for pgn_path in changed:
+            if pgn_path in self.files:
+                _merge_move_tree(touched, self.files.pop(pgn_path))
+            if pgn_path in read:
+                _merge_move_tree(touched, read[pgn_path])
+        self.files.update(read)
+        self.input_paths = input_paths
+
+        self._update_review_node(self.tree, self._merged_tree(), touched)
+        self._report_changes()
+        if self.deleted_moves:
+            self._create_backup()
+        self.tree = self.tree.compacted()
+        self.generation += 1
+        if self.db is not None:
+            self._load_reviews()
+        self.compact()
+        self._build_index()
+        return True
+
+    def _update_review_node(self, dst_tree: BookTree, src_tree: BookTree, touched: Optional[BookTree] = None):
+        """
+        Adds the moves of src_tree missing in dst_tree and removes those not in src_tree, keeping the review times
+        of dst_tree. Subtrees with the same structural hash are skipped, or with touched, those without its moves.
+        """
+        self.deleted_moves = self.added_moves = 0
+        if touched is None:
+            dst_hashes, src_hashes = dst_tree.subtree_hashes(), src_tree.subtree_hashes()
+        stack = [(ROOT, ROOT, ROOT)]
+        while stack:
+            dst_node, src_node, touched_node = stack.pop()
+            for dst_variation in dst_tree.children(dst_node):
+                if src_tree.child(src_node, dst_tree.moves[dst_variation]) is None:
+                    self.deleted_moves += dst_tree.subtree_size(dst_variation)
+                    dst_tree.remove_child(dst_node, dst_variation)
+            for src_variation in src_tree.children(src_node):
+                packed_move = src_tree.moves[src_variation]
+                dst_variation = dst_tree.child(dst_node, packed_move)
+                if dst_variation is None:
+                    self.added_moves += dst_tree.add_subtree(dst_node, src_tree, src_variation)[1]
+                elif touched is None:
+                    if dst_hashes[dst_variation] != src_hashes[src_variation]:
+                        stack.append((dst_variation, src_variation, None))
+                else:
+                    touched_variation = touched.child(touched_node, packed_move)
+                    if touched_variation is not None:
+                        stack.append((dst_variation, src_variation, touched_variation))
+
+    def _same_reviews(self, signature, cached_signature) -> bool:
+        # whether the review times of the cached tree are still valid, i.e. the review PGN did not change
+        if self.db is not None:
+            return True
+        review_path = str(self.path)
+        old, new = ([entry for entry in s if entry[0] == review_path] for s in (cached_signature, signature))
+        return bool(old) and tree_cache.same_content(new, old)
+
+    def _report_changes(self):
+        if self.added_moves or self.deleted_moves:
+            print(f"{self.added_moves} move(s) added, {self.deleted_moves} move(s) deleted", file=sys.stderr)
+
+    @stats.timed('book.save')
     def _save(self):
-        with open(self.path, 'w', encoding='utf-8') as pgn:
-            print(self.tree, file=pgn, end="\n\n")
+        self.export_pgn(self.path)
 
     def _create_backup(self):
         backup_dir = self.path.parent / 'backup'
         os.makedirs(backup_dir, exist_ok=True)
-        backup_file = backup_dir / (self.path.name + '.' + clk.now().isoformat())
-        shutil.copyfile(self.path, backup_file)
-        print(f"{self.deleted_moves} move(s) deleted, backup created: {backup_file}", file=sys.stderr)
+        if self.db is not None:
+            backup_file = backup_dir / (self.db.path.name + '.' + clk.now().isoformat())
+            self.db.backup(backup_file)
+        else:
+            backup_file = backup_dir / (self.path.name + '.' + clk.now().isoformat())
+            shutil.copyfile(self.path, backup_file)
+        if self.journal_path.exists():
+            shutil.copyfile(self.journal_path, backup_dir / (self.journal_path.name + '.' + clk.now().isoformat()))
+        print(f"backup created: {backup_file}", file=sys.stderr)
@@ -3,3 +3,9 @@ from datetime import timedelta
 INITIAL_INTERVAL = timedelta(minutes=10)
 MAX_INTERVAL = timedelta(days=180)
 INTERVAL_INC_FACTOR = 2.2
+
+# Treat positions reached by a different move order as in book (instead of out of prep)
+TRANSPOSITIONS = False
+
+# Where review times are stored: 'pgn' (comments of review/<color>.pgn) or 'sqlite' (review/<color>.sqlite)
+STORAGE = 'pgn'
@@ -0,0 +1,94 @@
+"""
+SQLite storage of the review state, used instead of the review PGN when review_config.STORAGE is 'sqlite'.
+
+    python review_db.py export    # writes ~/.repertition/review/<color>.pgn from the databases
+    python review_db.py import    # replaces the databases with the contents of the review PGNs
+"""
+
+import os
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+import chess
+
+from book_tree import NONE
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reviews (
+    path TEXT PRIMARY KEY,  -- moves from the starting position in UCI notation, separated by spaces
+    review_time INTEGER NOT NULL,  -- seconds since the epoch, the minimum integer if never reviewed
+    interval INTEGER  -- minutes
+);
+CREATE INDEX IF NOT EXISTS reviews_review_time ON reviews (review_time);
+"""
+
+
+class ReviewDatabase:
+    """Review time and interval of each user move, keyed by the path of the move. Every update is its own transaction."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        # the connection is shared by the threads using the book, which serializes the calls with its lock
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+
+    def rows(self) -> Iterable[Tuple[str, int, int]]:
+        for path, review_time, interval in self.conn.execute("SELECT path, review_time, interval FROM reviews"):
+            yield path, review_time, NONE if interval is None else interval
+
+    def set(self, path: str, review_time: int, interval: int) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO reviews VALUES (?, ?, ?)",
+                          (path, review_time, None if interval == NONE else interval))
+
+    def update(self, rows: Iterable[Tuple[str, int, int]] = (), deleted: Iterable[str] = ()) -> None:
+        """Inserts or replaces rows and deletes paths, in one transaction."""
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("DELETE FROM reviews WHERE path = ?", ((path,) for path in deleted))
+            self.conn.executemany("INSERT OR REPLACE INTO reviews VALUES (?, ?, ?)",
+                                  ((path, rt, None if iv == NONE else iv) for path, rt, iv in rows))
+
+    def count_until(self, timestamp: int) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM reviews WHERE review_time <= ?", (timestamp,)).fetchone()[0]
+
+    def first(self) -> Optional[int]:
+        return self.conn.execute("SELECT MIN(review_time) FROM reviews").fetchone()[0]
+
+    def backup(self, path: Path) -> None:
+        dst = sqlite3.connect(path)
+        try:
+            self.conn.backup(dst)
+        finally:
+            dst.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    import review_config
+    from review_book import ReviewBook
+
+    if len(sys.argv) != 2 or sys.argv[1] not in ('import', 'export'):
+        sys.exit(f"usage: {sys.argv[0]} import|export")
+    review_config.STORAGE = 'sqlite'
+    topdir = Path().home() / '.repertition'
+    for color, name in ((chess.WHITE, 'white'), (chess.BLACK, 'black')):
+        pgn_path = topdir / 'review' / (name + '.pgn')
+        if sys.argv[1] == 'import':
+            db_path = pgn_path.with_suffix('.sqlite')
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(str(db_path) + suffix):
+                    os.remove(str(db_path) + suffix)
+        book = ReviewBook(pgn_path, topdir / 'repertoire' / name, color)
+        if sys.argv[1] == 'export':
+            book.export_pgn(pgn_path)
+        print(f"{name}: {len(book.db)} user moves {sys.argv[1]}ed", file=sys.stderr)
@@ -0,0 +1,170 @@
+"""
+Simulates review sessions to compare review_config parameters without playing real games.
+
+    python simulate.py --color white --days 90 --factor 1.8 2.2 3 --max-interval 30 180
+
+A simulated user plays a number of games every day against a copy of the book (the review files in
+~/.repertition/review are never written). Each user move is recalled with probability
+(1 - error) * 0.5 ** (time since the last review / half-life), the half-life growing with every
+successful recall and resetting after a mistake, so intervals that are too long cost retention.
+For each parameter set, the workload (moves reviewed per day) and retention (share of correct moves)
+are reported per simulated week.
+"""
+
+import argparse
+import itertools
+import json
+import random
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import chess
+
+import clk
+import review_config
+from book_tree import ROOT, pack_move
+from review_book import ReviewBook
+
+
+class User:
+    """Memory of the simulated user: when each move was last reviewed and how long it is remembered."""
+
+    def __init__(self, error, half_life: timedelta, half_life_growth, rng: random.Random):
+        self.error = error
+        self.half_life = half_life.total_seconds()
+        self.half_life_growth = half_life_growth
+        self.rng = rng
+        self.memory = {}  # node: (last review timestamp, half-life in seconds)
+
+    def recalls(self, node, now: float) -> bool:
+        last, half_life = self.memory.get(node, (now, self.half_life))
+        recall = (1 - self.error) * 0.5 ** ((now - last) / half_life)
+        correct = self.rng.random() < recall
+        self.memory[node] = now, half_life * self.half_life_growth if correct else self.half_life
+        return correct
+
+
+def play_game(book: ReviewBook, user: User, now: datetime, move_time: timedelta, rng: random.Random):
+    """Plays one game from the starting position, returns (user moves, correct user moves, time spent)."""
+    tree = book.tree
+    board = chess.Board()
+    session = book.open_session()
+    node = ROOT
+    reviewed = correct = 0
+    start = now
+    while True:
+        now += move_time
+        clk.set_fake_time(now)
+        if board.turn != book.user_color:
+            move, bottom_reached, _ = book.next_move(board, session)
+            if move is None or bottom_reached:
+                break
+            node = tree.child(node, pack_move(move))
+            board.push(move)
+            continue
+        main = tree.main_child(node)
+        if main is None:
+            break
+        reviewed += 1
+        if user.recalls(main, now.timestamp()):
+            correct += 1
+            board.push(tree.move(main))
+            node = main
+        else:
+            board.push(rng.choice([m for m in board.legal_moves if m != tree.move(main)]))
+            book.next_move(board, session)  # records the mistake
+            break
+    return reviewed, correct, now - start
+
+
+def simulate(book: ReviewBook, initial_state, args, initial_interval, factor, max_interval):
+    """Runs args.days of sessions with the given parameters from the initial review times, returns the statistics per day."""
+    review_config.INITIAL_INTERVAL = initial_interval
+    review_config.INTERVAL_INC_FACTOR = factor
+    review_config.MAX_INTERVAL = max_interval
+    book.tree.review_times, book.tree.intervals = (a[:] for a in initial_state)
+    book._build_index()
+
+    rng = random.Random(args.seed)
+    user = User(args.error, timedelta(hours=args.half_life), args.half_life_growth, rng)
+    move_time = timedelta(seconds=args.move_seconds)
+    days = []
+    for day in range(args.days):
+        now = args.start + timedelta(days=day)
+        clk.set_fake_time(now)
+        reviewed = correct = games = 0
+        while games < args.games and book.pending_review_count():
+            r, c, spent = play_game(book, user, now, move_time, rng)
+            reviewed, correct, games, now = reviewed + r, correct + c, games + 1, now + spent
+        clk.set_fake_time(now)
+        days.append({"games": games, "reviewed": reviewed, "correct": correct, "backlog": book.pending_review_count()})
+    return days
+
+
+def weekly(days):
+    weeks = []
+    for i in range(0, len(days), 7):
+        week = days[i:i + 7]
+        reviewed = sum(d["reviewed"] for d in week)
+        weeks.append({
+            "reviews_per_day": round(reviewed / len(week), 1),
+            "retention": round(sum(d["correct"] for d in week) / reviewed, 3) if reviewed else None,
+            "backlog": week[-1]["backlog"],
+        })
+    return weeks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate review sessions for several review_config parameter sets.")
+    parser.add_argument('--color', choices=('white', 'black'), default='white')
+    parser.add_argument('--topdir', type=Path, default=Path().home() / '.repertition')
+    parser.add_argument('--from-review', action='store_true', help="start from the current review times instead of a new repertoire")
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--games', type=int, default=20, help="maximum games per day")
+    parser.add_argument('--error', type=float, default=0.05, help="probability of a mistake even right after a review")
+    parser.add_argument('--half-life', type=float, default=24, help="initial half-life of the memory of a move (hours)")
+    parser.add_argument('--half-life-growth', type=float, default=2.5, help="half-life factor after a correct move")
+    parser.add_argument('--move-seconds', type=float, default=10, help="time per move")
+    parser.add_argument('--initial-interval', type=float, nargs='+', default=[review_config.INITIAL_INTERVAL.total_seconds() / 60], help="minutes")
+    parser.add_argument('--factor', type=float, nargs='+', default=[review_config.INTERVAL_INC_FACTOR])
+    parser.add_argument('--max-interval', type=float, nargs='+', default=[review_config.MAX_INTERVAL.days], help="days")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=Path, help="JSON report (default: stdout)")
+    args = parser.parse_args()
+    args.start = datetime.now(timezone.utc).replace(microsecond=0)
+
+    # the book works on a copy of the review files, and nothing is written while simulating
+    workdir = Path(tempfile.mkdtemp(prefix='repertition-sim-'))
+    try:
+        review_config.STORAGE = 'pgn'
+        review_path = args.topdir / 'review' / (args.color + '.pgn')
+        for path in (review_path, review_path.with_name(review_path.name + '.journal')):
+            if args.from_review and path.exists():
+                shutil.copy(path, workdir)
+        book = ReviewBook(workdir / review_path.name, args.topdir / 'repertoire' / args.color,
+                          chess.WHITE if args.color == 'white' else chess.BLACK)
+        book.persistent = False
+        initial_state = book.tree.review_times[:], book.tree.intervals[:]
+    finally:
+        shutil.rmtree(workdir)
+
+    results = []
+    for initial, factor, maximum in itertools.product(args.initial_interval, args.factor, args.max_interval):
+        days = simulate(book, initial_state, args, timedelta(minutes=initial), factor, timedelta(days=maximum))
+        results.append({
+            "initial_interval_minutes": initial, "factor": factor, "max_interval_days": maximum,
+            "reviews": sum(d["reviewed"] for d in days),
+            "retention": round(sum(d["correct"] for d in days) / max(1, sum(d["reviewed"] for d in days)), 3),
+            "weeks": weekly(days),
+        })
+    output = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
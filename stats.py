@@ -0,0 +1,118 @@
+import cProfile
+import functools
+import io
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+
+# profile the Nth move with cProfile when collecting (None: never)
+PROFILE_MOVE = None
+
+# collect timings from the start (can also be switched with the "stats on" UCI command)
+enabled = False
+
+timings = {}
+moves = 0
+profile_report = None
+lock = threading.Lock()
+
+
+class Timing:
+    """Number of calls, total and maximum time, and a histogram with power-of-two buckets (in microseconds)."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        bucket = int(seconds * 1e6).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def __str__(self):
+        histogram = " ".join(f"<{1 << b}us:{n}" for b, n in sorted(self.buckets.items()))
+        return (f"count {self.count} total {self.total * 1e3:.1f}ms mean {self.total / self.count * 1e6:.0f}us "
+                f"max {self.max * 1e6:.0f}us | {histogram}")
+
+
+def set_enabled(on):
+    global enabled
+    enabled = on
+
+
+def reset():
+    global moves, profile_report
+    with lock:
+        timings.clear()
+        moves = 0
+        profile_report = None
+
+
+def record(name, seconds):
+    with lock:
+        timing = timings.get(name)
+        if timing is None:
+            timing = timings[name] = Timing()
+        timing.add(seconds)
+
+
+def timed(name):
+    """Decorator collecting the latency of each call; only a flag check when disabled."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def move():
+    """Wraps the computation of a move, the PROFILE_MOVE-th one is profiled."""
+    global moves, profile_report
+    if not enabled:
+        yield
+        return
+    with lock:
+        moves += 1
+        profile = moves == PROFILE_MOVE
+    if not profile:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(30)
+        profile_report = out.getvalue()
+
+
+def report() -> str:
+    with lock:
+        lines = [f"moves {moves}"]
+        lines += [f"{name}: {timing}" for name, timing in sorted(timings.items())]
+        if profile_report:
+            lines += [f"profile of move {PROFILE_MOVE}:", profile_report]
+    return "\n".join(lines)
+
+
+def write(path):
+    if not enabled:
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        print(report(), file=f)
@@ -0,0 +1,44 @@
+"""
+A minimal UCI engine for the bridge tests: "go movetime N" waits N milliseconds (100 by default) and plays the
+first legal move. While searching, its process id is in the file given by the FAKE_ENGINE_SEARCHING environment
+variable, if any, so that tests can kill it in the middle of a search.
+"""
+
+import os
+import sys
+import time
+
+import chess
+
+
+def main():
+    board = chess.Board()
+    searching = os.environ.get('FAKE_ENGINE_SEARCHING')
+    for line in sys.stdin:
+        tokens = line.split()
+        if not tokens:
+            continue
+        if tokens[0] == 'uci':
+            print('id name fake\nuciok', flush=True)
+        elif tokens[0] == 'isready':
+            print('readyok', flush=True)
+        elif tokens[0] == 'position':
+            board = chess.Board() if tokens[1] == 'startpos' else chess.Board(' '.join(tokens[2:8]))
+            if 'moves' in tokens:
+                for uci in tokens[tokens.index('moves') + 1:]:
+                    board.push_uci(uci)
+        elif tokens[0] == 'go':
+            movetime = int(tokens[tokens.index('movetime') + 1]) if 'movetime' in tokens else 100
+            if searching:
+                with open(searching, 'w') as f:
+                    print(os.getpid(), file=f)
+            time.sleep(movetime / 1000)
+            if searching and os.path.exists(searching):
+                os.remove(searching)
+            print(f'info depth 1 score cp 0\nbestmove {next(iter(board.legal_moves))}', flush=True)
+        elif tokens[0] == 'quit':
+            break
+
+
+if __name__ == '__main__':
+    main()
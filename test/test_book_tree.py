@@ -0,0 +1,49 @@
+import unittest
+
+import chess
+
+from book_tree import ROOT, WIDE_NODE, BookTree, pack_move
+
+
+class TestBookTree(unittest.TestCase):
+    def test_children(self):
+        tree = BookTree()
+        moves = [pack_move(m) for m in chess.Board().legal_moves]
+        children = [tree.add_child(ROOT, m) for m in moves]
+        self.assertGreaterEqual(len(moves), WIDE_NODE)
+        self.assertIn(ROOT, tree.wide)
+        self.assertEqual(tree.children(ROOT), children)
+        self.assertEqual(tree.main_child(ROOT), children[0])
+        self.assertEqual([tree.child(ROOT, m) for m in moves], children)
+        self.assertEqual(tree.turn(children[0]), chess.BLACK)
+
+        grandchild = tree.add_child(children[3], pack_move(chess.Move.from_uci('e7e5')))
+        self.assertEqual(tree.path(grandchild), [moves[3], pack_move(chess.Move.from_uci('e7e5'))])
+        self.assertEqual(tree.find(tree.path(grandchild)), grandchild)
+
+        tree.remove_child(ROOT, children[3])
+        self.assertIsNone(tree.child(ROOT, moves[3]))
+        self.assertEqual(tree.children(ROOT), children[:3] + children[4:])
+
+        compacted = tree.compacted()
+        self.assertEqual(len(compacted), len(moves))
+        self.assertEqual([compacted.moves[c] for c in compacted.children(ROOT)], moves[:3] + moves[4:])
+        self.assertIsNone(compacted.find(tree.path(grandchild)))
+
+    def test_subtree_hashes(self):
+        e4, e5, c5, nf3 = (pack_move(chess.Move.from_uci(uci)) for uci in ('e2e4', 'e7e5', 'c7c5', 'g1f3'))
+        a, b = BookTree(), BookTree()
+        for tree, replies in ((a, (e5, c5)), (b, (c5, e5))):
+            node = tree.add_child(ROOT, e4)
+            for reply in replies:
+                tree.add_child(node, reply)
+        self.assertEqual(a.subtree_hashes()[ROOT], b.subtree_hashes()[ROOT])
+
+        c = BookTree()
+        child, count = c.add_subtree(ROOT, a, a.child(ROOT, e4))
+        self.assertEqual(count, 3)
+        self.assertEqual(c.subtree_hashes()[ROOT], a.subtree_hashes()[ROOT])
+        c.add_child(c.child(child, e5), nf3)
+        self.assertNotEqual(c.subtree_hashes()[ROOT], a.subtree_hashes()[ROOT])
+        self.assertEqual(c.subtree_size(ROOT), 5)
+
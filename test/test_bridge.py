@@ -0,0 +1,100 @@
+import os
+import shutil
+import signal
+import sys
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import chess
+import chess.engine
+
+import bridge
+
+
+ENGINE = [sys.executable, 'test/fake_engine.py']
+
+
+def position(*ucis):
+    board = chess.Board()
+    for uci in ucis:
+        board.push_uci(uci)
+    return board
+
+
+class TestBridge(unittest.TestCase):
+    def setUp(self):
+        self.topdir = Path('test/tmp')
+        if self.topdir.exists():
+            shutil.rmtree(self.topdir)
+        os.makedirs(self.topdir)
+        self.searching = self.topdir / 'searching'
+        os.environ['FAKE_ENGINE_SEARCHING'] = str(self.searching)
+        bridge.init(ENGINE, size=2)
+
+    def tearDown(self):
+        bridge.cleanup()
+        del os.environ['FAKE_ENGINE_SEARCHING']
+        shutil.rmtree(self.topdir)
+
+    def test_pool(self):
+        self.assertEqual(bridge.engine_count, 1)
+        limit = chess.engine.Limit(time=0.3)
+        boards = [position(), position('e2e4'), position('d2d4')]
+        with ThreadPoolExecutor(len(boards)) as pool:
+            moves = list(pool.map(lambda board: bridge.next_move(board, limit), boards))
+        for board, move in zip(boards, moves):
+            self.assertIn(move, board.legal_moves)
+        # engines are started on demand, up to the pool size
+        self.assertEqual(bridge.engine_count, 2)
+        self.assertEqual(len(bridge.idle_engines), 2)
+
+        # an engine that fails to start is not counted
+        engines = [bridge._checkout(), bridge._checkout()]
+        bridge.pool_size = 3
+        command, bridge.engine_command = bridge.engine_command, str(self.topdir / 'missing')
+        with self.assertRaises(OSError):
+            bridge._checkout()
+        bridge.engine_command = command
+        self.assertEqual(bridge.engine_count, 2)
+        for engine in engines:
+            bridge._release(engine)
+
+        bridge.cleanup()
+        self.assertEqual(bridge.engine_count, 0)
+        self.assertEqual(bridge.idle_engines, [])
+
+    def test_concurrent_searches(self):
+        # waiting for a search in progress (e.g. the one of pondering) doesn't hold up searches of other positions
+        finished = {}
+
+        def search(name, board, seconds):
+            bridge.next_move(board, chess.engine.Limit(time=seconds))
+            finished[name] = time.monotonic()
+
+        with ThreadPoolExecutor(3) as pool:
+            pool.submit(search, 'pondering', position(), 1.5)
+            time.sleep(0.2)
+            pool.submit(search, 'ponderhit', position(), 1.5)
+            time.sleep(0.1)
+            pool.submit(search, 'other game', position('d2d4'), 0.1)
+        self.assertEqual(len(finished), 3)
+        self.assertLess(finished['other game'], finished['pondering'])
+        self.assertGreaterEqual(finished['ponderhit'], finished['pondering'])
+
+    def test_engine_killed(self):
+        board = position('e2e4', 'e7e5')
+        with ThreadPoolExecutor(1) as pool:
+            search = pool.submit(bridge.next_move, board, chess.engine.Limit(time=1))
+            deadline = time.monotonic() + 10
+            while not self.searching.exists() or not self.searching.read_text().strip():
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+            killed = int(self.searching.read_text())
+            os.kill(killed, signal.SIGKILL)
+            # the search is started again with a new engine
+            self.assertIn(search.result(timeout=10), board.legal_moves)
+        self.assertEqual(bridge.engine_count, 1)
+        self.assertEqual(len(bridge.idle_engines), 1)
+        self.assertNotEqual(bridge.idle_engines[0].protocol.transport.get_pid(), killed)
@@ -0,0 +1,24 @@
+import unittest
+
+import chat
+
+
+class TestChat(unittest.TestCase):
+    def setUp(self):
+        chat.set_queued(True)
+        chat.RETRY_DELAY = 0.01
+
+    def tearDown(self):
+        chat.set_queued(False)
+
+    def test_queued_batch(self):
+        posts, failures = [], [Exception("timeout")]
+
+        def post(msg):
+            if failures:
+                raise failures.pop()
+            posts.append(msg)
+
+        chat.send_batch(["Sorry, that's not the move!", "Correct move: Nf3", "x" * 130], post)
+        chat.flush()
+        self.assertEqual(posts, ["Sorry, that's not the move! Correct move: Nf3", "x" * 130])
@@ -0,0 +1,42 @@
+import unittest
+
+import chess
+import chess.engine
+
+from communication import command, go_limit
+
+
+class TestCommunication(unittest.TestCase):
+    def test_position(self):
+        board = chess.Board()
+        command(board, None, "position startpos moves e2e4 e7e5")
+        first_move = board.move_stack[0]
+        command(board, None, "position startpos moves e2e4 e7e5 g1f3 b8c6")
+        self.assertIs(board.move_stack[0], first_move)
+        self.assertEqual(len(board.move_stack), 4)
+
+        command(board, None, "position startpos moves e2e4 c7c5")
+        self.assertIsNot(board.move_stack[0], first_move)
+        self.assertEqual(board.fen(), chess.Board("rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2").fen())
+
+        fen = "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2"
+        command(board, None, f"position fen {fen} moves g1f3")
+        first_move = board.move_stack[0]
+        command(board, None, f"position fen {fen} moves g1f3 b8c6")
+        self.assertIs(board.move_stack[0], first_move)
+        self.assertEqual(board.root().fen(), fen)
+
+        command(board, None, "position startpos")
+        self.assertEqual(board.fen(), chess.STARTING_FEN)
+
+    def test_go_limit(self):
+        limit = go_limit("go wtime 60000 btime 45500 winc 1000 binc 0 movestogo 20")
+        self.assertEqual((limit.white_clock, limit.black_clock, limit.white_inc, limit.black_inc), (60, 45.5, 1, 0))
+        self.assertEqual(limit.remaining_moves, 20)
+        self.assertEqual(go_limit("go movetime 500 depth 12"), chess.engine.Limit(time=0.5, depth=12))
+        self.assertIsNone(go_limit("go"))
+        self.assertIsNone(go_limit("go infinite"))
+
+        limits = []
+        command(chess.Board(), lambda board, limit: limits.append(limit) or chess.Move.from_uci("e2e4"), "go nodes 1000")
+        self.assertEqual(limits, [chess.engine.Limit(nodes=1000)])
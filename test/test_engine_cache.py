@@ -0,0 +1,110 @@
+import os
+import shutil
+import unittest
+from pathlib import Path
+
+import chess
+import chess.engine
+import chess.polyglot
+
+import bridge
+from engine_cache import MATE_SCORE, TIME_TOLERANCE, EngineCache
+from time_manager import TimeManager
+
+
+def result(uci, depth=10, score=None, pov=chess.WHITE):
+    info = {'depth': depth}
+    if score is not None:
+        info['score'] = chess.engine.PovScore(score, pov)
+    return chess.engine.PlayResult(chess.Move.from_uci(uci), None, info)
+
+
+def board(*ucis):
+    board = chess.Board()
+    for uci in ucis:
+        board.push_uci(uci)
+    return board
+
+
+class TestEngineCache(unittest.TestCase):
+    def setUp(self):
+        self.topdir = Path('test/tmp')
+        if self.topdir.exists():
+            shutil.rmtree(self.topdir)
+        os.makedirs(self.topdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.topdir)
+
+    def test_put_get(self):
+        cache = EngineCache(None)
+        self.assertIsNone(cache.get(board()))
+        cache.put(board(), result('e2e4', score=chess.engine.Cp(30)))
+        self.assertIn(board(), cache)
+        self.assertEqual(cache.get(board()), chess.Move.from_uci('e2e4'))
+        self.assertNotIn(board('e2e4'), cache)
+        cache.put(board('e2e4'), chess.engine.PlayResult(None, None))  # no move, e.g. game over
+        self.assertNotIn(board('e2e4'), cache)
+
+    def test_limit(self):
+        # a reply is only reused for searches no deeper and not much longer than the one it comes from
+        cache = EngineCache(None)
+        cache.put(board(), result('e2e4', depth=12), chess.engine.Limit(time=1))
+        e4 = chess.Move.from_uci('e2e4')
+        self.assertEqual(cache.get(board(), chess.engine.Limit(time=1)), e4)
+        self.assertEqual(cache.get(board(), chess.engine.Limit(time=0.5, depth=12)), e4)
+        self.assertEqual(cache.get(board(), chess.engine.Limit(time=TIME_TOLERANCE)), e4)
+        self.assertIsNone(cache.get(board(), chess.engine.Limit(time=TIME_TOLERANCE + 0.5)))
+        self.assertIsNone(cache.get(board(), chess.engine.Limit(time=60)))
+        self.assertIsNone(cache.get(board(), chess.engine.Limit(depth=30)))
+
+        timed = result('e7e5')
+        timed.info['time'] = 2.5
+        cache.put(board('e2e4'), timed)
+        self.assertEqual(cache.get(board('e2e4'), chess.engine.Limit(time=2)), chess.Move.from_uci('e7e5'))
+
+        key = chess.polyglot.zobrist_hash(board())
+        cache.entries[key] = cache.entries[key][:3]  # written by an older version, without the time
+        self.assertEqual(cache.get(board()), e4)
+        self.assertIsNone(cache.get(board(), chess.engine.Limit(time=1)))
+
+    def test_precomputed(self):
+        # replies precomputed in the background are served in games with usual time controls
+        cache = EngineCache(None)
+        cache.put(board(), result('e2e4'), chess.engine.Limit(time=bridge.PRECOMPUTE_TIME))
+        for minutes, increment in ((1, 0), (3, 2), (10, 5)):
+            clock = chess.engine.Limit(white_clock=minutes * 60, black_clock=minutes * 60,
+                                       white_inc=increment, black_inc=increment)
+            self.assertEqual(cache.get(board(), TimeManager().engine_limit(board(), clock)), chess.Move.from_uci('e2e4'))
+
+    def test_eviction(self):
+        cache = EngineCache(None, max_entries=2)
+        cache.put(board(), result('e2e4'))
+        cache.put(board('e2e4'), result('e7e5'))
+        cache.get(board())  # now the most recently used
+        cache.put(board('d2d4'), result('d7d5'))
+        self.assertIn(board(), cache)
+        self.assertNotIn(board('e2e4'), cache)
+        self.assertIn(board('d2d4'), cache)
+
+    def test_save(self):
+        path = self.topdir / 'engine_cache'
+        cache = EngineCache(path)
+        cache.put(board(), result('e2e4'))
+        cache.put(board('f2f3', 'e7e5', 'g2g4'), result('d8h4', score=chess.engine.Mate(1), pov=chess.BLACK))
+        cache.save()
+        loaded = EngineCache(path)
+        self.assertEqual(loaded.get(board()), chess.Move.from_uci('e2e4'))
+        mate = loaded.entries[chess.polyglot.zobrist_hash(board('f2f3', 'e7e5', 'g2g4'))]
+        self.assertEqual(mate[2], MATE_SCORE - 1)  # mate in one
+
+        path.write_bytes(b'corrupt')
+        self.assertEqual(len(EngineCache(path).entries), 0)
+
+    def test_illegal_move(self):
+        # e.g. a Zobrist hash collision: the stored move is not played in another position
+        cache = EngineCache(None)
+        cache.put(board(), result('e2e4'))
+        key = next(iter(cache.entries))
+        cache.entries[key] = ('e7e5',) + cache.entries[key][1:]
+        self.assertIsNone(cache.get(board()))
@@ -0,0 +1,49 @@
+import os
+import shutil
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import chess
+
+import clk
+
+try:
+    import forecast
+except ImportError:  # NumPy is optional
+    forecast = None
+
+from review_book import ReviewBook
+
+
+@unittest.skipIf(forecast is None, "NumPy is not installed")
+class TestForecast(unittest.TestCase):
+    def setUp(self):
+        self.topdir = Path('test/tmp')
+        if self.topdir.exists():
+            shutil.rmtree(self.topdir)
+        os.makedirs(self.topdir / 'review')
+        shutil.copytree('test/repertoire', self.topdir / 'repertoire')
+
+    def tearDown(self):
+        shutil.rmtree(self.topdir)
+
+    def test_forecast(self):
+        clk.set_fake_time(datetime.fromisoformat('2023-01-01T12:00:00+00:00'))
+        book = ReviewBook(self.topdir / 'review' / 'black.pgn', self.topdir / 'repertoire' / 'black', chess.BLACK)
+        board = chess.Board()
+        for san in ('e4', 'e5', 'Nf3', 'Nc6'):
+            if board.turn == chess.WHITE:
+                self.assertEqual(book.next_move(board)[0], board.parse_san(san))
+            board.push_san(san)
+        book.next_move(board)
+
+        arrays = forecast.ReviewArrays(book, depth=1)
+        self.assertEqual(len(arrays), 3)
+        due_now, counts = arrays.due_counts(clk.now(), timedelta(hours=2), 3600)
+        self.assertEqual(due_now, 1)
+        self.assertEqual(counts.tolist(), [2, 0])
+        self.assertEqual(dict(arrays.interval_histogram())['<1h'], 2)
+        openings = [(forecast.opening_name(book, node), total, due, soon)
+                    for node, total, due, soon in arrays.by_opening(clk.now(), timedelta(hours=2))]
+        self.assertEqual(openings, [('1. e4', 2, 0, 2), ('1. d4', 1, 1, 1)])
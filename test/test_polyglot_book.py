@@ -0,0 +1,47 @@
+import os
+import shutil
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import chess
+
+import clk
+import polyglot_book
+from review_book import ReviewBook
+
+
+class TestPolyglotBook(unittest.TestCase):
+    def setUp(self):
+        self.topdir = Path('test/tmp')
+        if self.topdir.exists():
+            shutil.rmtree(self.topdir)
+        os.makedirs(self.topdir / 'review')
+        shutil.copytree('test/repertoire', self.topdir / 'repertoire')
+        clk.set_fake_time(datetime.fromisoformat('2023-01-01T12:00:00+00:00'))
+
+    def tearDown(self):
+        shutil.rmtree(self.topdir)
+
+    def test_export(self):
+        book = ReviewBook(self.topdir / 'review' / 'black.pgn', self.topdir / 'repertoire' / 'black', chess.BLACK)
+        board = chess.Board()
+        for san in ('e5', 'Nc6'):
+            board.push(book.next_move(board)[0])
+            board.push_san(san)
+        self.assertEqual(book.next_move(board)[1], True)  # bottom reached, e4 line is reviewed
+
+        bin_path = self.topdir / 'polyglot' / 'black.bin'
+        self.assertEqual(polyglot_book.export(book, bin_path), 6)
+        pg = polyglot_book.PolyglotBook(bin_path)
+        try:
+            self.assertEqual(pg.next_move(chess.Board()), chess.Move.from_uci('d2d4'))
+            board = chess.Board()
+            board.push_san('e4')
+            self.assertEqual(pg.next_move(board), chess.Move.from_uci('e7e5'))
+            board.push_san('e5')
+            self.assertEqual(pg.next_move(board), chess.Move.from_uci('g1f3'))
+            board.push_san('d4')
+            self.assertIsNone(pg.next_move(board))
+        finally:
+            pg.close()
@@ -1,3 +1,5 @@
+import bz2
+import gzip
 import os
 import shutil
 import unittest
@@ -8,7 +10,7 @@ import chess
 
 import clk
 import review_config
-from review_book import ReviewBook, ReviewNode
+from review_book import ReviewBook, ReviewSummary
 
 
 class TestReviewBook(unittest.TestCase):
@@ -16,6 +18,8 @@ class TestReviewBook(unittest.TestCase):
         review_config.INITIAL_INTERVAL = timedelta(minutes=10)
         review_config.MAX_INTERVAL = timedelta(days=2)
         review_config.INTERVAL_INC_FACTOR = 6
+        review_config.TRANSPOSITIONS = False
+        review_config.STORAGE = 'pgn'
 
         self.topdir = Path('test/tmp')
         self.repdir = self.topdir / 'repertoire'
@@ -161,12 +165,210 @@ class TestReviewBook(unittest.TestCase):
         self._play('a3 @fail/e4')
         self.assertEqual(self.book.pending_review_count(), 1)
 
+    def test_journal(self):
+        self._start_review(chess.BLACK, '2023-01-01T12:00:00')
+        review_pgn = (self.revdir / 'black.pgn').read_text()
+        self._play('e4 e5  Nf3 Nc6  @bottom')
+        self.assertEqual((self.revdir / 'black.pgn').read_text(), review_pgn)
+        self.assertEqual(len(self.book.journal_path.read_text().splitlines()), 2)
+
+        self._start_review(chess.BLACK, '2023-01-01T12:01:00')
+        self.assertEqual(self.book.pending_review_count(), 1)
+        self._check_review_node('e4 e5  Nf3', '2023-01-01T12:10:00', '0+1:00')
+
+        self._play('d4 d5  @bottom')
+        self.book.compact()
+        self.assertFalse(self.book.journal_path.exists())
+        self.assertIn('[%review 2023-01-01T12:11:00+00:00]', (self.revdir / 'black.pgn').read_text())
+
+    def test_review_index(self):
+        self._start_review(chess.BLACK, '2023-01-01T12:00:00')
+        self.assertEqual(self.book.next_review_time(), clk.now())
+        self._play('e4 e5  Nf3 Nc6  @bottom')
+        self._play_from_start('d4 d5  @bottom')
+        self.assertEqual(self.book.pending_review_count(), 0)
+        self.assertEqual(self.book.pending_review_count(within=timedelta(minutes=9)), 0)
+        self.assertEqual(self.book.pending_review_count(within=timedelta(minutes=10)), 3)
+        self.assertEqual(self.book.next_review_time().isoformat(), '2023-01-01T12:10:00+00:00')
+
+    def test_session(self):
+        self._start_review(chess.WHITE, '2023-01-01T12:00:00')
+        session = self.book.open_session()
+        for san in 'e4 e5 Nf3 Nc6'.split():
+            session.advance(self.board.push_san(san))
+        self.assertEqual(session.node, self.book._find_node(self.board)[0])
+        self.assertEqual(self.book.tree.move(session.previous), chess.Move.from_uci('g1f3'))
+
+        self.board.pop()
+        self.board.push_san('d6')
+        session.sync(self.board)
+        self.assertIsNone(session.node)
+        self.assertEqual(self.book.tree.move(session.previous), chess.Move.from_uci('g1f3'))
+
+        self.board.push_san('d4')
+        session.sync(self.board)
+        self.assertIsNone(session.node)
+        self.assertIsNone(session.previous)
+
+    def test_cache(self):
+        self._start_review(chess.WHITE, '2023-01-01T12:00:00')
+        self.assertTrue(self.book.cache_path.exists())
+        self._play('e4 e5  Nf3 Nc6  Bc4 Nf6  Ng5 d5  exd5 Nxd5  Nxf7 Kxf7  Qf3+ @bottom')
+
+        review_mtime = os.stat(self.revdir / 'white.pgn').st_mtime_ns
+        self._start_review(chess.WHITE, '2023-01-01T12:01:00')
+        self.assertEqual(os.stat(self.revdir / 'white.pgn').st_mtime_ns, review_mtime)
+        self.assertEqual(self.book.pending_review_count(), 7)
+        self._check_review_node('e4 e5  Nf3 Nc6  Bc4 Nf6', '2023-01-01T12:10:00', '0+1:00')
+
+        with open(self.repdir / 'white' / '01_evans_gambit.pgn', 'a') as pgn:
+            print('\n\n1. e4 c5 2. Nf3 *', file=pgn)
+        self._start_review(chess.WHITE, '2023-01-01T12:02:00')
+        self.assertNotEqual(os.stat(self.revdir / 'white.pgn').st_mtime_ns, review_mtime)
+        self.assertEqual(self.book.added_moves, 2)
+        self.assertEqual(self.book.pending_review_count(), 8)  # with the new Nf3
+        self._check_review_node('e4 e5  Nf3 Nc6  Bc4 Nf6', '2023-01-01T12:10:00', '0+1:00')
+
+    def test_sqlite_storage(self):
+        self._start_review(chess.BLACK, '2023-01-01T12:00:00')
+        self._play('e4 e5  Nf3 Nc6  @bottom')
+
+        # the review PGN is imported into the new database
+        review_config.STORAGE = 'sqlite'
+        self._start_review(chess.BLACK, '2023-01-01T12:01:00')
+        self.assertEqual(len(self.book.db), 3)
+        self.assertEqual(self.book.pending_review_count(), 1)
+        self._play('d4 d5  @bottom')
+        self._check_review_node('d4', '2023-01-01T12:11:00', '0+1:00')
+        self.book.db.close()
+
+        os.remove(self.revdir / 'black.pgn')
+        for cached in (True, False):
+            if not cached:
+                os.remove(self.book.cache_path)
+            self._start_review(chess.BLACK, '2023-01-01T12:10:00')
+            self.assertEqual(self.book.pending_review_count(), 2)
+            self.assertEqual(self.book.next_review_time().isoformat(), '2023-01-01T12:10:00+00:00')
+            self._check_review_node('e4 e5  Nf3', '2023-01-01T12:10:00', '0+1:00')
+            self._check_review_node('d4', '2023-01-01T12:11:00', '0+1:00')
+            self.book.db.close()
+
+        self._start_review(chess.BLACK, '2023-01-01T12:10:00')
+        self.book.export_pgn(self.revdir / 'black.pgn')
+        review_config.STORAGE = 'pgn'
+        self._start_review(chess.BLACK, '2023-01-01T12:10:00')
+        self._check_review_node('d4', '2023-01-01T12:11:00', '0+1:00')
+
+    def test_summary(self):
+        self._start_review(chess.BLACK, '2023-01-01T12:00:00')
+        self._play('e4 e5  Nf3 Nc6  @bottom')
+        path, input_dir = self.revdir / 'black.pgn', self.repdir / 'black'
+        self.assertIsNone(ReviewSummary.load(path, input_dir))  # not compacted yet
+
+        self.book.compact()
+        summary = ReviewSummary.load(path, input_dir)
+        self.assertEqual(summary.pending_review_count(), 1)
+        self.assertEqual(summary.pending_review_count(within=timedelta(minutes=10)), 3)
+        self.assertEqual(summary.next_review_time(), clk.now())
+
+        with open(input_dir / 'dummy.pgn', 'a') as pgn:
+            print('\n\n1. c4 e5 *', file=pgn)
+        self.assertIsNone(ReviewSummary.load(path, input_dir))
+
+    def test_multi_game_files(self):
+        with gzip.open(self.repdir / 'black' / 'chapters.pgn.gz', 'wt') as pgn:
+            print('[Event "1"]\n\n1. c4 e5 *\n\n[Event "2"]\n\n1. Nf3 d5 *\n', file=pgn)
+            print('[Event "3"]\n[FEN "8/8/8/4k3/8/8/8/4K2R w K - 0 1"]\n\n1. Rh5+ Kd4 *\n', file=pgn)
+            # the starting position written as a FEN, as some tools do
+            print(f'[Event "4"]\n[SetUp "1"]\n[FEN "{chess.STARTING_FEN}"]\n\n1. g3 d5 *\n', file=pgn)
+        with bz2.open(self.repdir / 'black' / 'more.pgn.bz2', 'wt') as pgn:
+            print('1. b3 e5 *', file=pgn)
+        self._start_review(chess.BLACK, '2023-01-01T12:00:00')
+        self.assertEqual(self.book.pending_review_count(), 7)
+        self._play('c4 e5 @bottom')
+        self._play_from_start('Nf3 d5 @bottom')
+        self._check_review_node('c4', '2023-01-01T12:10:00', '0+1:00')
+
+    def test_reload(self):
+        self._start_review(chess.BLACK, '2023-01-01T12:00:00')
+        self.assertFalse(self.book.reload())
+        self._play('e4 e5  Nf3 Nc6  @bottom')
+        self.assertEqual(self.book.pending_review_count(), 1)
+
+        with open(self.repdir / 'black' / 'dummy.pgn', 'w') as pgn:
+            print('1. e4 e5 2. Nf3 Nc6 (2... Nf6) 3. Bc4 Bc5 *', file=pgn)
+        with open(self.repdir / 'black' / 'new.pgn', 'w') as pgn:
+            print('1. c4 e5 *', file=pgn)
+        self.assertTrue(self.book.reload())
+        self.assertEqual(self.book.deleted_moves, 2)  # d4 d5
+        self.assertEqual(self.book.added_moves, 4)  # Bc4 Bc5 c4 e5, Nf6 being an alternative user move
+        self.assertIn('black.pgn.2023-01-01T12:00:00+00:00', os.listdir(self.revdir / 'backup'))
+        self.assertEqual(self.book.pending_review_count(), 2)  # Bc4 and c4
+        self._check_review_node('e4 e5  Nf3', '2023-01-01T12:10:00', '0+1:00')
+        self._check_review_node('d4', None, None)
+        self._play_from_start('e4 e5  Nf3 Nc6  Bc4 Bc5 @bottom')
+        self._play_from_start('c4 e5 @bottom')
+
+        # a file that can't be read leaves the book as it was
+        files, signature, nodes = dict(self.book.files), list(self.book.signature), len(self.book.tree)
+        with open(self.repdir / 'black' / 'latin1.pgn', 'wb') as pgn:
+            pgn.write('[Event "Caf\xe9"]\n\n1. b3 e5 *\n'.encode('latin-1'))
+        with self.assertRaises(UnicodeDecodeError):
+            self.book.reload()
+        self.assertEqual((self.book.files, self.book.signature, len(self.book.tree)), (files, signature, nodes))
+        os.remove(self.repdir / 'black' / 'latin1.pgn')
+        self.assertFalse(self.book.reload())
+
+        os.remove(self.book.cache_path)  # the review PGN is then compared with the whole repertoire
+        self._start_review(chess.BLACK, '2023-01-01T12:01:00')
+        self.assertEqual((self.book.added_moves, self.book.deleted_moves), (0, 0))
+        self.assertEqual(self.book.pending_review_count(), 0)
+        self._check_review_node('c4', '2023-01-01T12:10:00', '0+1:00')
+
+    def test_not_persistent(self):
+        self._start_review(chess.BLACK, '2023-01-01T12:00:00')
+        self.book.persistent = False
+        review_mtime = os.stat(self.revdir / 'black.pgn').st_mtime_ns
+        self._play('e4 e5  Nf3 Nc6  @bottom')
+        self.assertEqual(self.book.pending_review_count(), 1)
+        self.assertFalse(self.book.journal_path.exists())
+        self.assertEqual(os.stat(self.revdir / 'black.pgn').st_mtime_ns, review_mtime)
+
+    def test_transpositions(self):
+        self._start_review(chess.BLACK, '2023-01-01T12:00:00')
+        self.board.set_fen('rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2')
+        self._play('Nf3 Nc6  @bottom')
+
+        self._start_review(chess.WHITE, '2023-01-01T12:00:00')
+        for san in 'e4 e5 Bc4 Nc6 Nf3'.split():
+            self.board.push_san(san)
+        self.assertEqual(self.book.next_move(self.board), (None, False, None))
+        review_config.TRANSPOSITIONS = True
+        self._play('Nf6  Ng5 d5')
+        self._check_review_node('e4 e5  Nf3 Nc6  Bc4 Nf6', '2023-01-01T12:10:00', '0+1:00')
+
+    def test_peek_move(self):
+        self._start_review(chess.BLACK, '2023-01-01T12:00:00')
+        self.board.push_san('d4')
+        self.assertEqual(self.book.expected_user_move(self.board, chess.Move.from_uci('e7e5')), None)
+        self.board.pop()
+        self.assertEqual(self.book.expected_user_move(self.board, chess.Move.from_uci('d2d4')), chess.Move.from_uci('d7d5'))
+        self._play('e4 e5')
+        self.assertEqual(self.book.peek_move(self.board), chess.Move.from_uci('g1f3'))
+        self.assertEqual(self.book.pending_review_count(), 3)
+        self._play('Nf3 Nc6  @bottom')
+        self.assertEqual(self.book.pending_review_count(), 1)
+
     def _start_review(self, color, faketime):
         clk.set_fake_time(datetime.fromisoformat(faketime + '+00:00'))
         name = 'white' if color == chess.WHITE else 'black'
         self.book = ReviewBook(self.revdir / (name + '.pgn'), self.repdir / name, color)
         self.board.reset()
 
+    def _play_from_start(self, moves):
+        self.board.reset()
+        self._play(moves)
+
     def _play(self, moves):
         for m in moves.split():
             parts = m.split('@')
@@ -201,13 +403,11 @@ class TestReviewBook(unittest.TestCase):
             return
 
         self.assertIsNotNone(node)
-        rn = ReviewNode(node)
-
-        rt = rn.review_time()
+        rt = self.book.review_time(node)
         self.assertIsNotNone(rt)
         self.assertEqual(rt.isoformat(), isotime + '+00:00')
 
-        i = rn.interval()
+        i = self.book.interval(node)
         self.assertIsNotNone(i)
         hours = int(i.seconds // 3600)
         minutes = int(i.seconds % 3600 // 60)
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+
+import stats
+
+
+@stats.timed('test.call')
+def call(x):
+    return x * 2
+
+
+class TestStats(unittest.TestCase):
+    def setUp(self):
+        stats.reset()
+
+    def tearDown(self):
+        stats.set_enabled(False)
+        stats.PROFILE_MOVE = None
+        stats.reset()
+
+    def test_disabled(self):
+        self.assertEqual(call(2), 4)
+        with stats.move():
+            pass
+        self.assertEqual(stats.timings, {})
+        self.assertEqual(stats.moves, 0)
+        with tempfile.TemporaryDirectory() as tmp:
+            stats.write(os.path.join(tmp, 'stats.txt'))
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_enabled(self):
+        stats.set_enabled(True)
+        for i in range(3):
+            self.assertEqual(call(i), i * 2)
+        timing = stats.timings['test.call']
+        self.assertEqual(timing.count, 3)
+        self.assertEqual(sum(timing.buckets.values()), 3)
+        self.assertGreaterEqual(timing.max * 3, timing.total)
+
+        timing = stats.Timing()
+        timing.add(0.000003)
+        timing.add(0.000100)
+        self.assertEqual(timing.buckets, {2: 1, 7: 1})  # 3us < 4us, 100us < 128us
+        self.assertIn("<4us:1 <128us:1", str(timing))
+
+        stats.PROFILE_MOVE = 2
+        for _ in range(2):
+            with stats.move():
+                call(1)
+        report = stats.report()
+        self.assertIn("moves 2", report)
+        self.assertIn("test.call: count 5", report)
+        self.assertIn("profile of move 2:", report)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'stats.txt')
+            stats.write(path)
+            with open(path, encoding='utf-8') as f:
+                self.assertEqual(f.read(), report + "\n")
+
+        stats.reset()
+        self.assertEqual(stats.timings, {})
+        self.assertEqual(stats.moves, 0)
+        self.assertIsNone(stats.profile_report)
+        self.assertEqual(stats.report(), "moves 0")
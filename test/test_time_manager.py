@@ -0,0 +1,54 @@
+import unittest
+
+import chess
+import chess.engine
+
+import time_manager
+from time_manager import TimeManager
+
+
+class TestTimeManager(unittest.TestCase):
+    def test_clock(self):
+        board = chess.Board()
+        limit = chess.engine.Limit(white_clock=60, black_clock=60, white_inc=0, black_inc=0)
+        manager = TimeManager()
+        self.assertAlmostEqual(manager.engine_limit(board, limit).time, 60 / time_manager.MOVES_TO_GO - time_manager.MOVE_OVERHEAD)
+
+        # the time of book moves is saved for the next engine moves
+        manager.book_move(board, limit)
+        manager.book_move(board, limit)
+        pondering = manager.engine_limit(board, limit, spend=False)
+        self.assertAlmostEqual(pondering.time, 4 - time_manager.MOVE_OVERHEAD)
+        self.assertAlmostEqual(manager.saved, 4)
+        self.assertEqual(manager.engine_limit(board, limit), pondering)
+        self.assertAlmostEqual(manager.saved, 2)
+
+        # but a search never takes more than a share of the remaining time
+        short = chess.engine.Limit(white_clock=1, black_clock=60, white_inc=2)
+        self.assertAlmostEqual(manager.engine_limit(board, short).time, 1 * time_manager.MAX_SHARE - time_manager.MOVE_OVERHEAD)
+        self.assertAlmostEqual(manager.saved, 2)
+        board.push_uci('e2e4')
+        self.assertAlmostEqual(manager.engine_limit(board, short).time, 3 - time_manager.MOVE_OVERHEAD)
+
+    def test_bullet(self):
+        # 1+0: the clock doesn't run during book moves, which must not make the first searches much longer
+        board = chess.Board()
+        limit = chess.engine.Limit(white_clock=60, black_clock=60, white_inc=0, black_inc=0)
+        manager = TimeManager()
+        for _ in range(10):
+            manager.book_move(board, limit)
+        clock = 60
+        for _ in range(5):
+            time = manager.engine_limit(board, chess.engine.Limit(white_clock=clock, white_inc=0)).time
+            self.assertLessEqual(time, 2 * 60 / time_manager.MOVES_TO_GO)
+            clock -= time
+        self.assertGreater(clock, 40)
+
+    def test_without_clock(self):
+        board = chess.Board()
+        manager = TimeManager()
+        self.assertIsNone(manager.engine_limit(board, None))
+        self.assertIsNone(manager.engine_limit(board, chess.engine.Limit()))
+        manager.book_move(board, chess.engine.Limit(time=5))
+        self.assertEqual(manager.saved, 0)
+        self.assertEqual(manager.engine_limit(board, chess.engine.Limit(time=5, depth=10)), chess.engine.Limit(time=5, depth=10))
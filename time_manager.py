@@ -0,0 +1,67 @@
+from typing import Optional
+
+import chess
+import chess.engine
+
+
+# moves the remaining time is shared between, when the GUI doesn't give movestogo
+MOVES_TO_GO = 30
+
+# share of the increment used by each move
+INCREMENT_SHARE = 0.8
+
+# never search longer than this share of the remaining time
+MAX_SHARE = 0.25
+
+# share of the time saved by book moves spent on each engine move, never more than its own budget:
+# the saved time is still on the clock, so it is part of the budgets already
+SAVED_SHARE = 0.5
+
+# kept on the clock for communication delays (seconds)
+MOVE_OVERHEAD = 0.1
+
+MIN_TIME = 0.01
+
+
+class TimeManager:
+    """
+    Search limits of the bridged engine in one game, from the "go" parameters of the GUI. Book replies
+    are instant, so the time they would have been given is saved, and spent on the following engine moves
+    (at most doubling their budgets).
+    """
+
+    def __init__(self):
+        self.saved = 0.0  # seconds
+
+    def book_move(self, board: chess.Board, limit: Optional[chess.engine.Limit]) -> None:
+        self.saved += self._budget(board, limit) or 0
+
+    def engine_limit(self, board: chess.Board, limit: Optional[chess.engine.Limit],
+                     spend: bool = True) -> Optional[chess.engine.Limit]:
+        """
+        The limit of the next engine search, None to use the default of the bridge. With spend False (pondering),
+        the saved time is only charged when the move is actually played.
+        """
+        budget = self._budget(board, limit)
+        if budget is None:
+            # movetime, depth or nodes only are used as given
+            if limit is None or (limit.time is None and limit.depth is None and limit.nodes is None):
+                return None
+            return chess.engine.Limit(time=limit.time, depth=limit.depth, nodes=limit.nodes)
+        remaining = limit.white_clock if board.turn == chess.WHITE else limit.black_clock
+        time = min(budget + min(self.saved * SAVED_SHARE, budget), remaining * MAX_SHARE)
+        if spend:
+            self.saved -= time - budget
+        return chess.engine.Limit(time=max(MIN_TIME, time - MOVE_OVERHEAD), depth=limit.depth, nodes=limit.nodes)
+
+    @staticmethod
+    def _budget(board: chess.Board, limit: Optional[chess.engine.Limit]) -> Optional[float]:
+        # time per move of the side to move, None without a clock (or with a fixed time per move)
+        if limit is None or limit.time is not None:
+            return None
+        remaining, increment = ((limit.white_clock, limit.white_inc) if board.turn == chess.WHITE
+                                else (limit.black_clock, limit.black_inc))
+        if remaining is None:
+            return None
+        budget = remaining / (limit.remaining_moves or MOVES_TO_GO) + (increment or 0) * INCREMENT_SHARE
+        return min(budget, remaining * MAX_SHARE)
@@ -0,0 +1,73 @@
+import hashlib
+import marshal
+import os
+from array import array
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+from book_tree import BookTree
+
+
+VERSION = 3
+
+ARRAYS = ('moves', 'parents', 'first_children', 'last_children', 'next_siblings', 'depths',
+          'review_times', 'intervals')
+
+
+def file_signature(paths: Sequence[Path], known: Sequence[tuple] = ()) -> List[tuple]:
+    """(path, size, mtime, sha1) of each existing file; hashes of files whose size and mtime are unchanged are reused from known."""
+    known_by_path = {entry[0]: entry for entry in known}
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entry = known_by_path.get(str(path))
+        if entry is None or entry[1] != st.st_size or entry[2] != st.st_mtime_ns:
+            with open(path, 'rb') as f:
+                entry = (str(path), st.st_size, st.st_mtime_ns, hashlib.sha1(f.read()).hexdigest())
+        signature.append(entry)
+    return signature
+
+
+def same_content(a: Sequence[tuple], b: Sequence[tuple]) -> bool:
+    return [(p, size, digest) for p, size, _, digest in a] == [(p, size, digest) for p, size, _, digest in b]
+
+
+def load(cache_path: Path) -> Optional[Tuple[List[tuple], tuple, dict]]:
+    """(signature, encoded tree, moves of each input file) or None."""
+    try:
+        with open(cache_path, 'rb') as f:
+            version, signature, encoded, files = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if version != VERSION:
+        return None
+    return signature, encoded, files
+
+
+def save(cache_path: Path, signature: Sequence[tuple], tree: BookTree, files: dict) -> None:
+    tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        marshal.dump((VERSION, list(signature), encode(tree), files), f)
+    os.replace(tmp_path, cache_path)
+
+
+def encode(tree: BookTree) -> tuple:
+    # the arrays are stored as is, so a tree is decoded without visiting its nodes
+    tree = tree.compacted()
+    arrays = tuple(getattr(tree, name).tobytes() for name in ARRAYS)
+    return tree.headers, arrays, tree.comments, list(tree.wide)
+
+
+def decode(encoded: tuple) -> BookTree:
+    headers, arrays, comments, wide = encoded
+    tree = BookTree(headers)
+    for name, data in zip(ARRAYS, arrays):
+        values = array(getattr(tree, name).typecode)
+        values.frombytes(data)
+        setattr(tree, name, values)
+    tree.comments = comments
+    tree.wide = {node: {tree.moves[c]: c for c in tree.children(node)} for node in wide}
+    return tree